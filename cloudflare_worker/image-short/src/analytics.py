@@ -0,0 +1,73 @@
+import time
+
+from db import statements
+
+# noinspection PyUnresolvedReferences
+from js import console
+# noinspection PyUnresolvedReferences
+from pyodide.ffi import to_js
+
+
+class ViewCounter:
+    def __init__(self, flush_interval=30, flush_threshold=100):
+        self._flush_interval = flush_interval
+        self._flush_threshold = flush_threshold
+        self._counts = {}
+        self._pending = 0
+        self._last_flush = time.time()
+        self._flushing = False
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def hit(self, shortcode):
+        hour = int(time.time() // 3600) * 3600
+        key = (shortcode, hour)
+        self._counts[key] = self._counts.get(key, 0) + 1
+        self._pending += 1
+
+    def should_flush(self):
+        if self._flushing or not self._pending:
+            return False
+
+        return (self._pending >= self._flush_threshold or
+                time.time() - self._last_flush >= self._flush_interval)
+
+    async def flush(self, database):
+        if self._flushing or not self._counts:
+            return
+
+        self._flushing = True
+        counts = self._counts
+        pending = self._pending
+        self._counts = {}
+        self._pending = 0
+        self._last_flush = time.time()
+
+        try:
+            batch = [
+                database.prepare(statements.upsert_views).bind(shortcode, hour, views)
+                for (shortcode, hour), views in counts.items()
+            ]
+            await database.batch(to_js(batch))
+            console.info(f'Flushed {pending} views for {len(counts)} shortcode hours')
+        except Exception as error:
+            # keep the counts for the next flush
+            for key, views in counts.items():
+                self._counts[key] = self._counts.get(key, 0) + views
+            self._pending += pending
+            console.error(f'Failed to flush views: {error}')
+        finally:
+            self._flushing = False
+
+    @staticmethod
+    async def stats(database, shortcode, hours=24):
+        since = int(time.time() // 3600) * 3600 - (hours - 1) * 3600
+        result = await database.prepare(statements.select_views).bind(shortcode, since).all()
+        rows = [{'hour': row.hour, 'views': row.views} for row in result.results]
+        return {
+            'shortcode': shortcode,
+            'views': sum(row['views'] for row in rows),
+            'hours': rows,
+        }
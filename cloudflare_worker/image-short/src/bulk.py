@@ -0,0 +1,184 @@
+import json
+import time
+
+from db import statements
+from db.params import prepare
+
+# noinspection PyUnresolvedReferences
+from js import console
+# noinspection PyUnresolvedReferences
+from js import TextDecoder
+# noinspection PyUnresolvedReferences
+from js import TextEncoder
+# noinspection PyUnresolvedReferences
+from pyodide.ffi import to_js
+
+
+async def export_shortcodes(database, writable, cursor=0, limit=20000, page_size=1000):
+    # NDJSON rows in id order, the last line holds the cursor to continue from
+    writer = writable.getWriter()
+    encoder = TextEncoder.new()
+    exported = 0
+    complete = False
+    try:
+        while exported < limit:
+            requested = min(page_size, limit - exported)
+            result = await database.prepare(statements.select_batch).bind(cursor, requested).all()
+            rows = result.results
+            if len(rows):
+                lines = [
+                    json.dumps({'id': row.id, 'shortcode': row.shortcode, 'key': row.key,
+                                'origin': row.origin, 'expires_at': row.expires_at})
+                    for row in rows
+                ]
+                await writer.write(encoder.encode('\n'.join(lines) + '\n'))
+                exported += len(rows)
+                cursor = rows[len(rows) - 1].id
+
+            if len(rows) < requested:
+                complete = True
+                break
+
+        trailer = {'cursor': cursor, 'exported': exported, 'complete': complete}
+    except Exception as error:
+        console.error(f'Export failed at cursor {cursor}: {error}')
+        trailer = {'cursor': cursor, 'exported': exported, 'complete': False, 'error': str(error)}
+
+    await writer.write(encoder.encode(json.dumps(trailer) + '\n'))
+    await writer.close()
+
+
+async def read_lines(stream):
+    reader = stream.getReader()
+    decoder = TextDecoder.new()
+    buffer = ''
+    while True:
+        chunk = await reader.read()
+        if chunk.done:
+            break
+
+        buffer += decoder.decode(chunk.value, stream=True)
+        lines = buffer.split('\n')
+        buffer = lines.pop()
+        for line in lines:
+            yield line
+
+    buffer += decoder.decode()
+    if buffer:
+        yield buffer
+
+
+def _parse_row(line, origins):
+    row = json.loads(line)
+    if not isinstance(row, dict):
+        raise ValueError('not an object')
+
+    shortcode, key = row.get('shortcode'), row.get('key')
+    origin, expires_at = row.get('origin'), row.get('expires_at')
+    if not isinstance(shortcode, str) or not shortcode or '/' in shortcode:
+        raise ValueError('invalid shortcode')
+    if not isinstance(key, str) or not key:
+        raise ValueError('invalid key')
+    if not origins.valid(origin):
+        raise ValueError('unknown origin')
+    if expires_at is not None and (isinstance(expires_at, bool) or not isinstance(expires_at, int)):
+        raise ValueError('invalid expires_at')
+    return shortcode, key, origin, expires_at
+
+
+class ImportResult:
+    def __init__(self, chunk_size=100):
+        self._chunk_size = chunk_size
+        self.chunks = []
+        self.rows = []
+        self.errors = []
+        self.first_line = None
+        self.shortcodes = []
+        self.total_rows = 0
+        self.queries = 0
+        self.stopped_at = None
+
+    @property
+    def full(self):
+        return len(self.rows) >= self._chunk_size
+
+    @property
+    def written(self):
+        return sum(chunk.get('written', 0) for chunk in self.chunks)
+
+
+async def _write_chunk(database, mirror, statement, result, last_line):
+    chunk = {'chunk': len(result.chunks), 'first_line': result.first_line, 'last_line': last_line,
+             'rows': len(result.rows), 'written': 0, 'errors': result.errors}
+    if result.rows:
+        try:
+            replace = statement == statements.import_replace
+            batch = []
+            if replace:
+                # run ahead of the writes in the same batch, only the rows that really change
+                # have a mirrored value to drop
+                batch.append(database.prepare(statements.select_changed).bind(json.dumps(result.rows)))
+            batch.extend(prepare(database, statement, *row) for row in result.rows)
+            # keys queued for removal by the watchdog are in use again
+            keys = json.dumps([row[1] for row in result.rows])
+            batch.append(database.prepare(statements.delete_referenced_purged).bind(keys, int(time.time())))
+            result.queries += len(batch)
+            results = await database.batch(to_js(batch))
+            first = 1 if replace else 0
+            chunk['written'] = sum(results[index].meta.changes for index in range(first, first + len(result.rows)))
+            result.shortcodes.extend(row[0] for row in result.rows)
+            if replace:
+                # replaced rows are mirrored again on their next lookup
+                for row in results[0].results:
+                    await mirror.delete(row.shortcode)
+        except Exception as error:
+            console.error(f'Import of chunk {chunk["chunk"]} failed: {error}')
+            chunk['error'] = str(error)
+
+    result.chunks.append(chunk)
+    result.rows = []
+    result.errors = []
+    result.first_line = None
+
+
+async def import_shortcodes(database, mirror, origins, lines, chunk_size=100, replace=False, max_rows=500,
+                            max_queries=900):
+    # every chunk is a single D1 batch, a chunk that fails does not affect the others,
+    # a request stops at max_rows rows or max_queries D1 queries so that it stays within the
+    # D1 query and KV operation limits of an invocation, the rest is sent again from stopped_at
+    statement = statements.import_replace if replace else statements.import_skip
+    overhead = 2 if replace else 1
+    result = ImportResult(chunk_size)
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        line = line.strip()
+        if not line:
+            continue
+
+        if result.first_line is None:
+            result.first_line = line_number
+        try:
+            if line.startswith('{"cursor"'):
+                # trailer of an export
+                continue
+            row = _parse_row(line, origins)
+            if (result.total_rows >= max_rows or
+                    result.queries + len(result.rows) + overhead + 1 > max_queries):
+                result.stopped_at = line_number
+                if result.first_line == line_number:
+                    result.first_line = None
+                break
+            result.rows.append(row)
+            result.total_rows += 1
+        except (ValueError, TypeError) as error:
+            result.errors.append({'line': line_number, 'error': str(error)})
+
+        if result.full:
+            await _write_chunk(database, mirror, statement, result, line_number)
+
+    if result.rows or result.errors:
+        last_line = line_number if result.stopped_at is None else result.stopped_at - 1
+        await _write_chunk(database, mirror, statement, result, last_line)
+
+    return result
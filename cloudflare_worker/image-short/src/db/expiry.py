@@ -0,0 +1,77 @@
+import json
+import time
+
+from db import statements
+from db.params import prepare
+
+# noinspection PyUnresolvedReferences
+from js import console
+# noinspection PyUnresolvedReferences
+from pyodide.ffi import to_js
+
+
+def expired(expires_at):
+    return expires_at is not None and expires_at <= time.time()
+
+
+async def purge_expired(database, mirror, budget, batch_size=100, max_batches=10):
+    # deletes expired shortcodes in bounded batches, their keys are queued in purged_keys
+    # for the watchdog to remove the images
+    now = int(time.time())
+    purged = 0
+    for _ in range(max_batches):
+        # a KV delete per mirrored row
+        limit = min(batch_size, budget.remaining) if mirror.enabled else batch_size
+        if limit < 1:
+            break
+
+        result = await database.prepare(statements.select_expired).bind(now, limit).all()
+        rows = result.results
+        if not rows:
+            break
+        if mirror.enabled:
+            budget.take(len(rows))
+
+        batch = []
+        for row in rows:
+            batch.append(prepare(database, statements.insert_purged, row.key, row.origin, now, row.id))
+        for row in rows:
+            batch.append(database.prepare(statements.delete_id).bind(row.id))
+            batch.append(database.prepare(statements.delete_views).bind(row.shortcode))
+        await database.batch(to_js(batch))
+
+        for row in rows:
+            await mirror.delete(row.shortcode)
+
+        purged += len(rows)
+        if len(rows) < limit:
+            break
+
+    if purged:
+        console.info(f'Purged {purged} expired shortcodes')
+    return purged
+
+
+async def purged_keys(database, limit=500):
+    result = await database.prepare(statements.select_purged).bind(limit).all()
+    return [{'key': row.key, 'origin': row.origin} for row in result.results]
+
+
+async def purgeable_keys(database, keys):
+    # keys taken up again by a shortcode since they were listed are dropped from the queue
+    if not keys:
+        return []
+
+    keys = json.dumps(keys)
+    await database.prepare(statements.delete_referenced_purged).bind(keys, int(time.time())).run()
+    result = await database.prepare(statements.select_purgeable).bind(keys).all()
+    return [row.key for row in result.results]
+
+
+async def acknowledge_purged(database, keys):
+    if not keys:
+        return 0
+
+    batch = [database.prepare(statements.delete_purged).bind(key) for key in keys]
+    await database.batch(to_js(batch))
+    return len(keys)
@@ -0,0 +1,61 @@
+from db import statements
+from db.params import prepare
+from db.schema import migrations, migrations_schema
+
+# noinspection PyUnresolvedReferences
+from js import console
+# noinspection PyUnresolvedReferences
+from pyodide.ffi import to_js
+
+
+async def schema_version(database):
+    result = await database.prepare(statements.schema_version).first()
+    return (result.version if result is not None else None) or 0
+
+
+async def migrate(database):
+    await database.prepare(migrations_schema).run()
+
+    version = await schema_version(database)
+    for migration_version, migration_statements in migrations:
+        if migration_version <= version:
+            continue
+
+        batch = [database.prepare(statement) for statement in migration_statements]
+        batch.append(database.prepare(statements.insert_schema_version).bind(migration_version))
+        try:
+            await database.batch(to_js(batch))
+            console.info(f'Database migrated to version {migration_version}')
+        except Exception as error:
+            # another isolate may have applied it first
+            if await schema_version(database) < migration_version:
+                raise
+            console.info(f'Database migration {migration_version} already applied: {error}')
+
+
+async def relativize_keys(database, origins, mirror, budget, batch_size=500, max_batches=10):
+    # online migration of absolute urls to relative keys, bounded per run, mirrored
+    # rows are dropped from KV so they are mirrored again with their relative key
+    changed = 0
+    prefixes = [(origins.default, None)] + [(url, origin) for origin, url in origins.origins.items()]
+    for prefix, origin in prefixes:
+        for _ in range(max_batches):
+            # a KV delete per migrated row
+            limit = min(batch_size, budget.remaining) if mirror.enabled else batch_size
+            if limit < 1:
+                break
+
+            result = await prepare(database, statements.relativize_keys, prefix, origin, limit).all()
+            rows = result.results
+            if mirror.enabled:
+                budget.take(len(rows))
+                for row in rows:
+                    await mirror.delete(row.shortcode)
+
+            changed += len(rows)
+            if len(rows) < limit:
+                break
+
+    if changed:
+        console.info(f'Migrated {changed} shortcode urls to relative keys')
+    return changed
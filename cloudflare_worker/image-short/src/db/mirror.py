@@ -0,0 +1,86 @@
+import json
+import time
+
+from db import statements
+
+# noinspection PyUnresolvedReferences
+from js import console
+
+
+class KVMirror:
+    cursor_key = '__backfill_cursor__'
+
+    def __init__(self, env):
+        self._kv = getattr(env, 'shortcode_kv', None)
+
+    @property
+    def enabled(self):
+        return self._kv is not None
+
+    async def get(self, shortcode):
+        if not self.enabled or shortcode.startswith('__'):
+            # internal keys sharing the namespace
+            return None
+
+        value = await self._kv.get(shortcode)
+        if not value:
+            return None
+
+        if not value.startswith('{'):
+            # mirrored before keys were relative, the value is the url
+            return value, None, None
+
+        value = json.loads(value)
+        return value['key'], value.get('origin'), value.get('expires_at')
+
+    async def put(self, shortcode, key, origin=None, expires_at=None):
+        if not self.enabled:
+            return
+
+        value = json.dumps({'key': key, 'origin': origin, 'expires_at': expires_at})
+        if expires_at is None:
+            await self._kv.put(shortcode, value)
+            return
+
+        # KV expirations must be at least 60 seconds away, a previous value must not outlive the row
+        if expires_at - time.time() >= 60:
+            await self._kv.put(shortcode, value, expiration=expires_at)
+        else:
+            await self._kv.delete(shortcode)
+
+    async def delete(self, shortcode):
+        if not self.enabled:
+            return
+
+        await self._kv.delete(shortcode)
+
+    async def backfill(self, database, budget, batch_size=500, max_batches=10):
+        if not self.enabled or not budget.take():
+            return 0
+
+        cursor = int(await self._kv.get(self.cursor_key) or 0)
+        mirrored = 0
+        for _ in range(max_batches):
+            # a put per row and one for the cursor
+            limit = min(batch_size, budget.remaining - 1)
+            if limit < 1:
+                break
+
+            result = await database.prepare(statements.select_batch).bind(cursor, limit).all()
+            rows = result.results
+            if not rows:
+                break
+            budget.take(len(rows) + 1)
+
+            for row in rows:
+                await self.put(row.shortcode, row.key, row.origin, row.expires_at)
+
+            mirrored += len(rows)
+            cursor = rows[len(rows) - 1].id
+            await self._kv.put(self.cursor_key, str(cursor))
+
+            if len(rows) < limit:
+                break
+
+        console.info(f'KV backfill mirrored {mirrored} shortcodes, cursor at {cursor}')
+        return mirrored
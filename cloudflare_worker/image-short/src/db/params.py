@@ -0,0 +1,15 @@
+import re
+
+_placeholder = re.compile(r'\?(\d+)')
+
+
+def prepare(database, statement, *values):
+    # None reaches D1 as undefined, which bind() rejects, NULL is written into the statement instead
+    nulls = {index for index, value in enumerate(values, 1) if value is None}
+    if nulls:
+        statement = _placeholder.sub(lambda match: 'NULL' if int(match.group(1)) in nulls else match.group(0),
+                                     statement)
+        # the parameter count is the highest placeholder left, skipped ones are bound but unused
+        count = max((int(index) for index in _placeholder.findall(statement)), default=0)
+        values = [0 if value is None else value for value in values[:count]]
+    return database.prepare(statement).bind(*values)
@@ -1,2 +1,17 @@
 shortcodes_schema = ('CREATE TABLE IF NOT EXISTS shortcodes '
                      '(id integer PRIMARY KEY, shortcode text NOT NULL UNIQUE, url text NOT NULL)')
+views_schema = ('CREATE TABLE IF NOT EXISTS shortcode_views '
+                '(shortcode text NOT NULL, hour integer NOT NULL, views integer NOT NULL DEFAULT 0, '
+                'PRIMARY KEY (shortcode, hour))')
+migrations_schema = 'CREATE TABLE IF NOT EXISTS schema_migrations (version integer PRIMARY KEY)'
+
+# applied in order after shortcodes_schema, each version runs once in a single batch
+migrations = [
+    (1, ['ALTER TABLE shortcodes RENAME COLUMN url TO key']),
+    (2, ['ALTER TABLE shortcodes ADD COLUMN origin integer']),
+    (3, ['CREATE INDEX IF NOT EXISTS shortcodes_key ON shortcodes (key)']),
+    (4, ['ALTER TABLE shortcodes ADD COLUMN expires_at integer',
+         'CREATE INDEX IF NOT EXISTS shortcodes_expires_at ON shortcodes (expires_at) WHERE expires_at IS NOT NULL',
+         'CREATE TABLE IF NOT EXISTS purged_keys '
+         '(key text PRIMARY KEY, origin integer, purged_at integer NOT NULL)']),
+]
@@ -1,6 +1,49 @@
-insert = 'INSERT INTO shortcodes (shortcode,url) VALUES (?1,?2)'
-select = 'SELECT shortcode, url FROM shortcodes WHERE shortcode = ?1'
+insert = 'INSERT INTO shortcodes (shortcode,key,origin,expires_at) VALUES (?1,?2,?3,?4)'
+select = 'SELECT shortcode, key, origin, expires_at FROM shortcodes WHERE shortcode = ?1'
 delete = 'DELETE FROM shortcodes WHERE shortcode = ?1'
-update = 'UPDATE shortcodes SET url = ?2 WHERE shortcode = ?1'
+update = 'UPDATE shortcodes SET key = ?2, origin = ?3 WHERE shortcode = ?1 RETURNING expires_at'
 exists = 'SELECT EXISTS(SELECT 1 FROM shortcodes WHERE shortcode = ?1)'
-select_url = 'SELECT shortcode FROM shortcodes WHERE url = ?1'
+# ?2 matches rows that still hold an absolute url, ?3 is the current time
+select_key = ('SELECT shortcode FROM shortcodes WHERE (key = ?1 OR key = ?2) '
+              'AND (expires_at IS NULL OR expires_at > ?3)')
+select_batch = 'SELECT id, shortcode, key, origin, expires_at FROM shortcodes WHERE id > ?1 ORDER BY id LIMIT ?2'
+upsert_views = ('INSERT INTO shortcode_views (shortcode,hour,views) VALUES (?1,?2,?3) '
+                'ON CONFLICT (shortcode,hour) DO UPDATE SET views = views + excluded.views')
+select_views = ('SELECT hour, views FROM shortcode_views WHERE shortcode = ?1 AND hour >= ?2 '
+                'ORDER BY hour DESC')
+schema_version = 'SELECT MAX(version) AS version FROM schema_migrations'
+insert_schema_version = 'INSERT INTO schema_migrations (version) VALUES (?1)'
+# strips the origin prefix ?1 from absolute urls, ?2 is the origin id, NULL for RAW_IMG_BASE_URL
+relativize_keys = ('UPDATE shortcodes SET key = substr(key, length(?1) + 1), origin = ?2 '
+                   'WHERE id IN (SELECT id FROM shortcodes WHERE substr(key, 1, length(?1)) = ?1 LIMIT ?3) '
+                   'RETURNING shortcode')
+count_shortcodes = 'SELECT COUNT(*) AS count FROM shortcodes'
+select_shortcodes = 'SELECT id, shortcode FROM shortcodes WHERE id > ?1 ORDER BY id LIMIT ?2'
+select_expired = ('SELECT id, shortcode, key, origin FROM shortcodes WHERE expires_at <= ?1 '
+                  'ORDER BY expires_at LIMIT ?2')
+delete_id = 'DELETE FROM shortcodes WHERE id = ?1'
+delete_views = 'DELETE FROM shortcode_views WHERE shortcode = ?1'
+# queued for the watchdog to remove, unless another shortcode that has not expired shares the key,
+# the storage holds a single object per key whatever the origin
+insert_purged = ('INSERT OR IGNORE INTO purged_keys (key,origin,purged_at) SELECT ?1, ?2, ?3 '
+                 'WHERE NOT EXISTS (SELECT 1 FROM shortcodes WHERE key = ?1 AND id != ?4 '
+                 'AND (expires_at IS NULL OR expires_at > ?3))')
+select_purged = 'SELECT key, origin FROM purged_keys ORDER BY purged_at LIMIT ?1'
+# ?1 is a JSON array of keys, ?2 the current time
+delete_referenced_purged = ('DELETE FROM purged_keys WHERE key IN (SELECT value FROM json_each(?1)) '
+                            'AND EXISTS (SELECT 1 FROM shortcodes WHERE shortcodes.key = purged_keys.key '
+                            'AND (expires_at IS NULL OR expires_at > ?2))')
+select_purgeable = 'SELECT key FROM purged_keys WHERE key IN (SELECT value FROM json_each(?1))'
+delete_purged = 'DELETE FROM purged_keys WHERE key = ?1'
+import_skip = ('INSERT INTO shortcodes (shortcode,key,origin,expires_at) VALUES (?1,?2,?3,?4) '
+               'ON CONFLICT (shortcode) DO NOTHING')
+import_replace = ('INSERT INTO shortcodes (shortcode,key,origin,expires_at) VALUES (?1,?2,?3,?4) '
+                  'ON CONFLICT (shortcode) DO UPDATE SET key = excluded.key, origin = excluded.origin, '
+                  'expires_at = excluded.expires_at WHERE key IS NOT excluded.key '
+                  'OR origin IS NOT excluded.origin OR expires_at IS NOT excluded.expires_at')
+# ?1 is a JSON array of [shortcode, key, origin, expires_at] rows, matches existing shortcodes that differ
+select_changed = ('SELECT shortcodes.shortcode FROM shortcodes JOIN json_each(?1) AS rows '
+                  'ON shortcodes.shortcode = json_extract(rows.value, \'$[0]\') '
+                  'WHERE shortcodes.key IS NOT json_extract(rows.value, \'$[1]\') '
+                  'OR shortcodes.origin IS NOT json_extract(rows.value, \'$[2]\') '
+                  'OR shortcodes.expires_at IS NOT json_extract(rows.value, \'$[3]\')')
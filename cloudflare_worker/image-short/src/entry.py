@@ -1,127 +1,364 @@
+import hmac
 import json
+import time
+from urllib.parse import parse_qs, urlsplit
 
+from analytics import ViewCounter
+from bulk import export_shortcodes, import_shortcodes, read_lines
 from db import statements
-from db.schema import shortcodes_schema
+from db.expiry import acknowledge_purged, expired, purge_expired, purgeable_keys, purged_keys
+from db.migrations import migrate, relativize_keys
+from db.mirror import KVMirror
+from db.params import prepare
+from db.schema import shortcodes_schema, views_schema
+from origins import Origins
+# the Durable Object class has to be exported from the entry module
+from rate_limit import RateLimiter, RateLimits  # noqa: F401
 from responses import Responses
+from shortcode_filter import ShortcodeFilter
+from storage import fetch_object, object_key
+from utils import KVBudget, defer
 
 # noinspection PyUnresolvedReferences
 from js import console
 # noinspection PyUnresolvedReferences
 from js import fetch
+# noinspection PyUnresolvedReferences
+from js import Headers
+# noinspection PyUnresolvedReferences
+from js import Response
+# noinspection PyUnresolvedReferences
+from js import TransformStream
 
 RESPONSES = Responses()
+VIEWS = ViewCounter()
+SHORTCODES = ShortcodeFilter()
+RATE_LIMITS = None
+DATABASE_PREPARED = False
+
+PROTECTED_PATHS = ('stats/', 'shortcodes/', 'expired/')
+
+FORWARDED_HEADERS = ['If-None-Match', 'If-Modified-Since', 'If-Match', 'If-Unmodified-Since', 'If-Range', 'Range']
 
 
 def authenticate(request, env):
     header_value = request.headers.get('X-Auth-PSK')
+    return bool(header_value) and hmac.compare_digest(header_value.encode('utf-8'),
+                                                      env.AUTHENTICATION_TOKEN.encode('utf-8'))
 
-    if not header_value or (header_value and header_value != env.AUTHENTICATION_TOKEN):
-        return RESPONSES.status_401()
+
+async def admit(request, env, authenticated):
+    global RATE_LIMITS
+    if RATE_LIMITS is None:
+        RATE_LIMITS = RateLimits.from_env(env)
+
+    kind, key = RateLimits.client(request, authenticated)
+    retry_after = await RATE_LIMITS.admit(env, kind, key)
+    if retry_after > 0:
+        return RESPONSES.status_429(request, RateLimits.retry_after(retry_after))
 
 
 async def prepare_database(env):
-    result = await env.image_db.prepare(shortcodes_schema).run()
-    if not result.success:
-        return RESPONSES.status_500()
+    global DATABASE_PREPARED
+    if DATABASE_PREPARED:
+        return
 
+    for schema in (shortcodes_schema, views_schema):
+        result = await env.image_db.prepare(schema).run()
+        if not result.success:
+            return RESPONSES.status_500()
 
-async def on_fetch(request, env):
-    await prepare_database(env)
+    await migrate(env.image_db)
+
+    DATABASE_PREPARED = True
 
+
+async def fetch_image(request, url):
+    headers = Headers.new()
+    for header in FORWARDED_HEADERS:
+        value = request.headers.get(header)
+        if value:
+            headers.set(header, value)
+
+    response = await fetch(url, method=request.method, headers=headers)
+    if request.method == 'HEAD':
+        return Response.new(None, status=response.status, statusText=response.statusText, headers=response.headers)
+
+    return response
+
+
+def ndjson_response(body):
+    headers = Headers.new()
+    headers.set('Content-Type', 'application/x-ndjson')
+    headers.set('Cache-Control', 'no-store')
+    return Response.new(body, status=200, headers=headers)
+
+
+async def on_fetch(request, env, ctx):
     cf_url = f'{env.CF_WORKER_BASE_URL.rstrip("/")}/'
-    img_url = f'{env.RAW_IMG_BASE_URL.rstrip("/")}/'
 
     request_url = request.url
     request_path = request_url.replace(cf_url, '')
 
+    # admission control before any database work
+    authenticated = authenticate(request, env)
+    limited = await admit(request, env, authenticated)
+    if limited:
+        return limited
+
+    if not authenticated and (request.method not in ('GET', 'HEAD') or request_path.startswith(PROTECTED_PATHS)):
+        return RESPONSES.status_401(request)
+
+    await prepare_database(env)
+    origins = Origins(env)
+
     console.info(f'Request URL: {request_url}')
     console.info(f'Request Path: {request_path}')
 
-    if '/' in request_path:
-        return RESPONSES.status_404()
+    if request_path.startswith('stats/') and request.method == 'GET':
+        # view counts for a shortcode, /stats/<shortcode>?hours=24
+        split_path = urlsplit(request_path)
+        shortcode = split_path.path[len('stats/'):]
+        if not shortcode or '/' in shortcode:
+            return RESPONSES.status_404(request)
+
+        try:
+            hours = int(parse_qs(split_path.query).get('hours', ['24'])[0])
+        except ValueError:
+            return RESPONSES.status_400(request)
+
+        stats = await VIEWS.stats(env.image_db, shortcode, max(1, min(hours, 24 * 90)))
+        return RESPONSES.status_200(json.dumps(stats))
+
+    if request_path.startswith('shortcodes/'):
+        # bulk export and import as NDJSON, /shortcodes/export?cursor=0&limit=20000 and
+        # /shortcodes/import?chunk=100&replace=1
+        split_path = urlsplit(request_path)
+        query = parse_qs(split_path.query)
+
+        if split_path.path == 'shortcodes/export' and request.method == 'GET':
+            try:
+                cursor = int(query.get('cursor', ['0'])[0])
+                limit = max(1, min(int(query.get('limit', ['20000'])[0]), 50000))
+            except ValueError:
+                return RESPONSES.status_400(request)
+
+            stream = TransformStream.new()
+            defer(ctx, export_shortcodes(env.image_db, stream.writable, cursor, limit))
+            return ndjson_response(stream.readable)
+
+        if split_path.path == 'shortcodes/import' and request.method == 'POST' and request.body is not None:
+            try:
+                chunk_size = max(1, min(int(query.get('chunk', ['100'])[0]), 500))
+            except ValueError:
+                return RESPONSES.status_400(request)
+            replace = query.get('replace', ['0'])[0] == '1'
+
+            result = await import_shortcodes(env.image_db, KVMirror(env), origins, read_lines(request.body),
+                                             chunk_size, replace)
+            if result.written:
+                await SHORTCODES.extend(env, result.shortcodes)
+
+            lines = [json.dumps(chunk) for chunk in result.chunks]
+            summary = {'chunks': len(result.chunks), 'written': result.written}
+            if result.stopped_at is not None:
+                # lines from here on were not read, sent again with the next request
+                summary['stopped_at'] = result.stopped_at
+            lines.append(json.dumps(summary))
+            return ndjson_response('\n'.join(lines) + '\n')
+
+        return RESPONSES.status_404(request)
+
+    if request_path.startswith('expired/'):
+        # keys of purged shortcodes for the watchdog to remove, checked again right before removing
+        # with a POST to /expired/keys/check and acknowledged with a POST once removed
+        split_path = urlsplit(request_path)
+
+        if split_path.path == 'expired/keys' and request.method == 'GET':
+            try:
+                limit = int(parse_qs(split_path.query).get('limit', ['500'])[0])
+            except ValueError:
+                return RESPONSES.status_400(request)
+
+            keys = await purged_keys(env.image_db, max(1, min(limit, 1000)))
+            return RESPONSES.status_200(json.dumps({'keys': keys}))
+
+        if split_path.path == 'expired/keys/check' and request.method == 'POST':
+            data = json.loads(await request.text())
+            keys = data.get('keys')
+            if not isinstance(keys, list):
+                return RESPONSES.status_400(request)
+
+            keys = await purgeable_keys(env.image_db, keys)
+            return RESPONSES.status_200(json.dumps({'keys': keys}))
+
+        if split_path.path == 'expired/keys' and request.method == 'POST':
+            data = json.loads(await request.text())
+            keys = data.get('keys')
+            if not isinstance(keys, list):
+                return RESPONSES.status_400(request)
+
+            acknowledged = await acknowledge_purged(env.image_db, keys)
+            return RESPONSES.status_200(json.dumps({'acknowledged': acknowledged}))
+
+        return RESPONSES.status_404(request)
 
-    if request.method == 'GET':
-        if not request_path:
-            return RESPONSES.status_404()
+    if '/' in request_path:
+        return RESPONSES.status_404(request)
 
-        result = await env.image_db.prepare(statements.select).bind(request_path).run()
-        if not result.results:
-            return RESPONSES.status_404()
+    mirror = KVMirror(env)
 
-        console.info(f'Fetching image at url: {result.results[0].url}')
-        return fetch(result.results[0].url)
+    if request.method in ('GET', 'HEAD'):
+        if not request_path:
+            return RESPONSES.status_404(request)
+
+        if not await SHORTCODES.might_contain(env, request_path):
+            # definitely not a shortcode, skip the database
+            return RESPONSES.status_404(request)
+
+        mirrored = await mirror.get(request_path)
+        if mirrored:
+            key, origin, expires_at = mirrored
+        else:
+            result = await env.image_db.prepare(statements.select).bind(request_path).run()
+            if not result.results:
+                return RESPONSES.status_404(request)
+
+            row = result.results[0]
+            key, origin, expires_at = row.key, row.origin, row.expires_at
+            if mirror.enabled and not expired(expires_at):
+                defer(ctx, mirror.put(request_path, key, origin, expires_at))
+
+        if expired(expires_at):
+            # purged by the scheduled handler
+            return RESPONSES.status_404(request)
+
+        url = origins.url(key, origin)
+
+        if request.method == 'GET':
+            VIEWS.hit(request_path)
+            if VIEWS.should_flush():
+                defer(ctx, VIEWS.flush(env.image_db))
+
+        bucket = getattr(env, 'image_bucket', None)
+        if bucket is not None and getattr(env, 'IMAGE_STORAGE', 'origin') == 'r2':
+            bucket_key = object_key(url, origins.default)
+            if bucket_key:
+                console.info(f'Fetching image from bucket: {bucket_key}')
+                response = await fetch_object(request, bucket, bucket_key)
+                if response is not None:
+                    return response
+
+        console.info(f'Fetching image at url: {url}')
+        return await fetch_image(request, url)
 
     elif request.method == 'POST':
-        authenticate(request, env)
         data = await request.text()
         data = json.loads(data)
 
         image_filename = data.get('shortcode')
         if image_filename and not data.get('image'):
-            image_filename = img_url + image_filename
             # return shortcode for image if exists
-            result = await env.image_db.prepare(statements.select_url).bind(image_filename).first()
+            result = await (env.image_db.prepare(statements.select_key)
+                            .bind(image_filename, origins.default + image_filename, int(time.time())).first())
             if hasattr(result, 'shortcode') and result.shortcode:
                 return RESPONSES.status_200(json.dumps({'shortcode': result.shortcode}))
 
-            return RESPONSES.status_404()
+            return RESPONSES.status_404(request)
 
         shortcode = data.get('shortcode')
         image_filename = data.get('image')
+        origin = data.get('origin')
+
+        # optional lifetime in seconds, the shortcode never expires without one
+        expires_in = data.get('expires_in')
+        if expires_in is not None and (isinstance(expires_in, bool) or not isinstance(expires_in, int)
+                                       or expires_in < 0):
+            return RESPONSES.status_400(request)
+        expires_at = int(time.time()) + expires_in if expires_in else None
 
-        if shortcode and image_filename:
+        if shortcode and image_filename and origins.valid(origin):
             result = await env.image_db.prepare(statements.exists).bind(shortcode).raw()
             if result[0][0] == 1:
-                return RESPONSES.status_409()
+                return RESPONSES.status_409(request)
 
             # add image entry to shortcode database
-            result = await (env.image_db.prepare(statements.insert)
-                            .bind(shortcode, img_url + image_filename).run())
+            result = await prepare(env.image_db, statements.insert, shortcode, image_filename, origin,
+                                   expires_at).run()
             if result.success and result.meta.changes > 0:
+                # the key is in use again, keep the watchdog from removing it
+                await env.image_db.prepare(statements.delete_purged).bind(image_filename).run()
+                await mirror.put(shortcode, image_filename, origin, expires_at)
+                await SHORTCODES.add(env, shortcode)
                 return RESPONSES.status_200()
 
-            return RESPONSES.status_500()
+            return RESPONSES.status_500(request)
 
-        return RESPONSES.status_400()
+        return RESPONSES.status_400(request)
 
     elif request.method == 'PUT':
         # modify image entry in shortcode database
-        authenticate(request, env)
         data = await request.text()
         data = json.loads(data)
 
         shortcode = data.get('shortcode')
         image_filename = data.get('image')
+        origin = data.get('origin')
 
-        if shortcode and image_filename:
+        if shortcode and image_filename and origins.valid(origin):
             result = await env.image_db.prepare(statements.exists).bind(shortcode).raw()
             if result[0][0] == 0:
-                return RESPONSES.status_404()
+                return RESPONSES.status_404(request)
 
-            result = await env.image_db.prepare(statements.update).bind(shortcode, img_url + image_filename).run()
+            result = await prepare(env.image_db, statements.update, shortcode, image_filename, origin).run()
             if result.success and result.meta.changes > 0:
+                await mirror.put(shortcode, image_filename, origin, result.results[0].expires_at)
                 return RESPONSES.status_200()
 
-            return RESPONSES.status_500()
+            return RESPONSES.status_500(request)
 
-        return RESPONSES.status_400()
+        return RESPONSES.status_400(request)
 
     elif request.method == 'DELETE':
         # delete image entry from shortcode database
-        authenticate(request, env)
-
         if not request_path:
-            return RESPONSES.status_404()
+            return RESPONSES.status_404(request)
 
         result = await env.image_db.prepare(statements.exists).bind(request_path).raw()
         if result[0][0] == 0:
-            return RESPONSES.status_404()
+            return RESPONSES.status_404(request)
 
         result = await (env.image_db.prepare(statements.delete)
                         .bind(request_path).run())
         if result.success and result.meta.changes > 0:
+            await mirror.delete(request_path)
             return RESPONSES.status_200()
 
-        return RESPONSES.status_500()
+        return RESPONSES.status_500(request)
+
+    return RESPONSES.status_404(request)
+
+
+async def run_job(name, job):
+    # a failing job does not keep the others from running
+    try:
+        await job
+    except Exception as error:
+        console.error(f'Scheduled job {name} failed: {error}')
+
 
-    return RESPONSES.status_404()
+async def scheduled_jobs(env):
+    budget = KVBudget()
+    mirror = KVMirror(env)
+
+    await run_job('relativize keys', relativize_keys(env.image_db, Origins(env), mirror, budget))
+    await run_job('purge expired', purge_expired(env.image_db, mirror, budget))
+    if mirror.enabled:
+        # the filter before the backfill, which takes whatever budget is left
+        await run_job('shortcode filter', SHORTCODES.build(env, budget))
+        await run_job('KV backfill', mirror.backfill(env.image_db, budget))
+
+
+async def on_scheduled(event, env, ctx):
+    await prepare_database(env)
+    defer(ctx, scheduled_jobs(env))
@@ -0,0 +1,33 @@
+import json
+
+
+class Origins:
+    def __init__(self, env):
+        self._default = f'{env.RAW_IMG_BASE_URL.rstrip("/")}/'
+        self._origins = {}
+
+        # optional, IMAGE_ORIGINS = '{"1": "https://images2.example.com"}'
+        origins = getattr(env, 'IMAGE_ORIGINS', None)
+        if origins:
+            for origin, url in json.loads(origins).items():
+                self._origins[int(origin)] = f'{url.rstrip("/")}/'
+
+    @property
+    def default(self):
+        return self._default
+
+    @property
+    def origins(self):
+        return self._origins
+
+    def valid(self, origin):
+        return origin is None or origin in self._origins
+
+    def url(self, key, origin=None):
+        if '://' in key:
+            # row not migrated yet, key is still an absolute url
+            return key
+
+        if origin is None:
+            return self._default + key
+        return self._origins.get(origin, self._default) + key
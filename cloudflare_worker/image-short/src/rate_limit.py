@@ -0,0 +1,164 @@
+import hashlib
+import json
+import math
+import time
+from collections import OrderedDict
+
+# noinspection PyUnresolvedReferences
+from js import console
+# noinspection PyUnresolvedReferences
+from js import Response
+
+try:
+    # noinspection PyUnresolvedReferences
+    from workers import DurableObject
+except ImportError:
+    # not available on older compatibility dates, the class is still exported but
+    # a rate_limiter binding needs a compatibility date that provides it
+    class DurableObject:
+        def __init__(self, ctx, env):
+            self.ctx = ctx
+            self.env = env
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.time()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, count=1):
+        # seconds until count tokens are available, 0 when they were taken
+        self._refill(time.time())
+        if self.tokens >= count:
+            self.tokens -= count
+            return 0.0
+        return (count - self.tokens) / self.rate
+
+    def grant(self, count):
+        # up to count whole tokens, for leases handed to isolates
+        self._refill(time.time())
+        granted = int(min(count, self.tokens))
+        self.tokens -= granted
+        return granted
+
+
+class Clients(OrderedDict):
+    # least recently seen clients are dropped first
+    def __init__(self, max_clients=10000):
+        super(Clients, self).__init__()
+        self._max_clients = max_clients
+
+    def put(self, key, value):
+        self[key] = value
+        self.move_to_end(key)
+        if len(self) > self._max_clients:
+            self.popitem(last=False)
+
+    def get_or_create(self, key, factory):
+        value = self.get(key)
+        if value is None:
+            value = factory()
+        self.put(key, value)
+        return value
+
+
+class RateLimits:
+    # token buckets per client ip and per psk, kept in the isolate, with a rate_limiter Durable Object
+    # binding the buckets are shared by every isolate and each isolate spends leased tokens locally
+    defaults = {
+        'ip': {'rate': 20, 'burst': 100},
+        'psk': {'rate': 200, 'burst': 1000},
+        'lease': 10,
+        'lease_ttl': 10,
+    }
+
+    def __init__(self, settings=None):
+        settings = settings or {}
+        self._limits = {kind: dict(self.defaults[kind], **settings.get(kind, {})) for kind in ('ip', 'psk')}
+        self._lease = max(1, settings.get('lease', self.defaults['lease']))
+        # unspent leased tokens are dropped after lease_ttl seconds, an idle isolate
+        # does not hold on to a burst that the other isolates were denied
+        self._lease_ttl = settings.get('lease_ttl', self.defaults['lease_ttl'])
+        self._buckets = Clients()
+        self._leases = Clients()
+        self._blocked = Clients()
+
+    @classmethod
+    def from_env(cls, env):
+        # optional, RATE_LIMITS = '{"ip": {"rate": 20, "burst": 100}, "psk": {"rate": 200, "burst": 1000}}'
+        settings = getattr(env, 'RATE_LIMITS', None)
+        return cls(json.loads(settings) if settings else None)
+
+    @staticmethod
+    def client(request, authenticated):
+        if authenticated:
+            psk = request.headers.get('X-Auth-PSK')
+            return 'psk', hashlib.sha256(psk.encode('utf-8')).hexdigest()[:16]
+
+        return 'ip', request.headers.get('CF-Connecting-IP') or 'unknown'
+
+    def _local(self, kind, key):
+        limit = self._limits[kind]
+        bucket = self._buckets.get_or_create(f'{kind}:{key}', lambda: TokenBucket(limit['rate'], limit['burst']))
+        return bucket.take()
+
+    async def _coordinated(self, env, kind, key):
+        name = f'{kind}:{key}'
+        blocked_until = self._blocked.get(name)
+        if blocked_until is not None:
+            if time.time() < blocked_until:
+                return blocked_until - time.time()
+            self._blocked.pop(name, None)
+
+        tokens, expires_at = self._leases.get(name, (0, 0.0))
+        if tokens > 0 and time.time() < expires_at:
+            self._leases.put(name, (tokens - 1, expires_at))
+            return 0.0
+
+        namespace = env.rate_limiter
+        stub = namespace.get(namespace.idFromName(name))
+        response = await stub.fetch('https://rate-limiter/lease', method='POST',
+                                    body=json.dumps(dict(self._limits[kind], count=self._lease)))
+        payload = json.loads(await response.text())
+        if payload['granted'] > 0:
+            self._leases.put(name, (payload['granted'] - 1, time.time() + self._lease_ttl))
+            return 0.0
+
+        # answered locally until the bucket has refilled
+        self._blocked.put(name, time.time() + payload['retry_after'])
+        return payload['retry_after']
+
+    async def admit(self, env, kind, key):
+        if getattr(env, 'rate_limiter', None) is not None:
+            try:
+                return await self._coordinated(env, kind, key)
+            except Exception as error:
+                console.error(f'Rate limiter unavailable, using isolate limits: {error}')
+
+        return self._local(kind, key)
+
+    @staticmethod
+    def retry_after(seconds):
+        return max(1, int(math.ceil(seconds)))
+
+
+class RateLimiter(DurableObject):
+    # one instance per client, grants leases of tokens from its bucket
+    def __init__(self, ctx, env):
+        super(RateLimiter, self).__init__(ctx, env)
+        self._bucket = None
+
+    async def fetch(self, request):
+        data = json.loads(await request.text())
+        if self._bucket is None or self._bucket.rate != data['rate'] or self._bucket.burst != data['burst']:
+            self._bucket = TokenBucket(data['rate'], data['burst'])
+
+        granted = self._bucket.grant(data['count'])
+        retry_after = 0.0 if granted else (1 - self._bucket.tokens) / self._bucket.rate
+        return Response.new(json.dumps({'granted': granted, 'retry_after': retry_after}))
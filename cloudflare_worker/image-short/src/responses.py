@@ -1,7 +1,20 @@
+import gzip
+import hashlib
+from functools import lru_cache
+
 from static.message import message_template
 
+# noinspection PyUnresolvedReferences
+from js import Headers
 # noinspection PyUnresolvedReferences
 from js import Response
+# noinspection PyUnresolvedReferences
+from pyodide.ffi import to_js
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 
 def message_response(title, message):
@@ -12,7 +25,94 @@ def message_response(title, message):
     return message_body
 
 
+@lru_cache(maxsize=64)
+def select_encoding(accept_encoding, encodings):
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        coding, _, parameters = part.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+
+        quality = 1.0
+        parameters = parameters.strip()
+        if parameters.startswith('q='):
+            try:
+                quality = float(parameters[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding] = quality
+
+    for encoding in encodings:
+        if accepted.get(encoding, accepted.get('*', 0.0)) > 0:
+            return encoding
+
+    return 'identity'
+
+
+class StaticResponse:
+    # rendered and compressed once, every variant is served as is
+    def __init__(self, status, body, cache_control='no-store', content_type='text/html; charset=utf-8'):
+        self._status = status
+        self._cache_control = cache_control
+        self._content_type = content_type
+
+        identity = body.encode('utf-8')
+        etag = hashlib.sha256(identity).hexdigest()[:16]
+
+        self._variants = {'identity': (to_js(identity), f'"{etag}"')}
+        self._variants['gzip'] = (to_js(gzip.compress(identity, compresslevel=9, mtime=0)), f'"{etag}-gzip"')
+        if brotli is not None:
+            self._variants['br'] = (to_js(brotli.compress(identity, quality=11)), f'"{etag}-br"')
+
+        self._encodings = tuple(encoding for encoding in ('br', 'gzip') if encoding in self._variants)
+
+    @property
+    def status(self):
+        return self._status
+
+    def response(self, request=None):
+        accept_encoding = request.headers.get('Accept-Encoding') if request is not None else None
+        encoding = select_encoding(accept_encoding, self._encodings)
+        body, etag = self._variants[encoding]
+
+        headers = Headers.new()
+        headers.set('Content-Type', self._content_type)
+        headers.set('Cache-Control', self._cache_control)
+        headers.set('ETag', etag)
+        headers.set('Vary', 'Accept-Encoding')
+        if encoding != 'identity':
+            headers.set('Content-Encoding', encoding)
+
+        if request is not None and request.method == 'HEAD':
+            body = None
+
+        # the body is already encoded, keep the runtime from compressing it again
+        return Response.new(body, status=self._status, headers=headers, encodeBody='manual')
+
+
 class Responses:
+    messages = {
+        400: ('Error', 'Invalid Request'),
+        401: ('Error', 'Unauthorized'),
+        404: ('Error', 'Not Found'),
+        409: ('Error', 'Conflict'),
+        429: ('Error', 'Too Many Requests'),
+        500: ('Error', 'Failed to create table in database'),
+    }
+
+    def __init__(self):
+        self._pages = {}
+
+    def _page(self, status):
+        page = self._pages.get(status)
+        if page is None:
+            title, message = self.messages[status]
+            # never cached, an unknown shortcode may be created a moment later
+            page = StaticResponse(status, message_response(title, message))
+            self._pages[status] = page
+        return page
+
     @staticmethod
     def status_200(json_data=None):
         body = ''
@@ -25,37 +125,22 @@ class Responses:
         response.headers.set('Content-Type', content_type)
         return response
 
-    @staticmethod
-    def status_400():
-        payload = message_response('Error', 'Invalid Request')
-        response = Response.new(payload, {'status': 400})
-        response.headers.set('Content-Type', 'text/html')
-        return response
+    def status_400(self, request=None):
+        return self._page(400).response(request)
 
-    @staticmethod
-    def status_401():
-        payload = message_response('Error', 'Unauthorized')
-        response = Response.new(payload, {'status': 401})
-        response.headers.set('Content-Type', 'text/html')
-        return response
+    def status_401(self, request=None):
+        return self._page(401).response(request)
 
-    @staticmethod
-    def status_404():
-        payload = message_response('Error', 'Not Found')
-        response = Response.new(payload, {'status': 404})
-        response.headers.set('Content-Type', 'text/html')
-        return response
+    def status_404(self, request=None):
+        return self._page(404).response(request)
 
-    @staticmethod
-    def status_409():
-        payload = message_response('Error', 'Conflict')
-        response = Response.new(payload, {'status': 409})
-        response.headers.set('Content-Type', 'text/html')
-        return response
+    def status_409(self, request=None):
+        return self._page(409).response(request)
 
-    @staticmethod
-    def status_500():
-        payload = message_response('Error', 'Failed to create table in database')
-        response = Response.new(payload, {'status': 500})
-        response.headers.set('Content-Type', 'text/html')
+    def status_429(self, request=None, retry_after=1):
+        response = self._page(429).response(request)
+        response.headers.set('Retry-After', str(retry_after))
         return response
+
+    def status_500(self, request=None):
+        return self._page(500).response(request)
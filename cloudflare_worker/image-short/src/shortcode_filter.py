@@ -0,0 +1,245 @@
+import base64
+import hashlib
+import json
+import math
+import time
+
+from db import statements
+
+# noinspection PyUnresolvedReferences
+from js import console
+
+
+class BloomFilter:
+    def __init__(self, bits, hashes, data=None, count=0):
+        self.bits = bits
+        self.hashes = hashes
+        self.count = count
+        self._data = bytearray(data) if data is not None else bytearray((bits + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        bits = int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        hashes = max(1, int(round(bits / capacity * math.log(2))))
+        return cls(bits, hashes)
+
+    @property
+    def capacity(self):
+        return int(self.bits * math.log(2) / self.hashes)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + index * second) % self.bits for index in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self._data[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self._data[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def dumps(self, **extra):
+        return json.dumps(dict(extra, bits=self.bits, hashes=self.hashes, count=self.count,
+                               data=base64.b64encode(bytes(self._data)).decode('ascii')))
+
+    @classmethod
+    def loads(cls, value):
+        payload = json.loads(value)
+        bloom_filter = cls(payload['bits'], payload['hashes'], base64.b64decode(payload['data']), payload['count'])
+        return bloom_filter, payload
+
+
+class ShortcodeFilter:
+    # membership filter of all shortcodes kept in the shortcode_kv namespace,
+    # built in batches by the scheduled handler and loaded once per isolate
+    filter_key = '__shortcode_filter__'
+    build_key = '__shortcode_filter_build__'
+    pending_prefix = '__shortcode_filter_add__:'
+    pending_cursor_key = '__shortcode_filter_add_cursor__'
+    # time of the last import, lookups go to the database until a full build started after it is published
+    stale_key = '__shortcode_filter_stale__'
+    # filters of an older layout are rebuilt
+    version = 2
+
+    def __init__(self, ttl=60, rebuild_interval=86400):
+        self._ttl = ttl
+        # rowids of deleted rows are reused, the id cursor can pass over a row that only a
+        # full build picks up, shortcodes created with a POST have a pending key until then
+        self._rebuild_interval = rebuild_interval
+        self._filter = None
+        self._stale = False
+        self._loaded_at = 0.0
+
+    @staticmethod
+    def _kv(env):
+        return getattr(env, 'shortcode_kv', None)
+
+    def _parse(self, value):
+        if not value:
+            return None, {}
+
+        bloom_filter, payload = BloomFilter.loads(value)
+        if payload.get('version') != self.version:
+            return None, {}
+        return bloom_filter, payload
+
+    async def _load(self, kv):
+        value = await kv.get(self.filter_key)
+        stale = await kv.get(self.stale_key)
+        self._loaded_at = time.time()
+        self._filter, payload = self._parse(value)
+        self._stale = stale is not None and float(stale) >= payload.get('started_at', 0)
+
+    async def might_contain(self, env, shortcode):
+        kv = self._kv(env)
+        if kv is None:
+            return True
+
+        if time.time() - self._loaded_at >= self._ttl:
+            try:
+                await self._load(kv)
+            except Exception as error:
+                console.error(f'Failed to load shortcode filter: {error}')
+                self._filter = None
+
+        if self._filter is None or self._stale:
+            # not built yet or behind an import, every lookup goes to the database
+            return True
+
+        if shortcode in self._filter:
+            return True
+
+        # created since the filter was published, possibly on another isolate
+        return await kv.get(self.pending_prefix + shortcode) is not None
+
+    async def add(self, env, shortcode):
+        kv = self._kv(env)
+        if kv is None:
+            return
+
+        if self._filter is not None:
+            self._filter.add(shortcode)
+        # kept until a published filter holds the shortcode, see _fold_pending
+        await kv.put(self.pending_prefix + shortcode, '1')
+
+    async def extend(self, env, shortcodes):
+        # too many for a pending key each, other isolates send every lookup to the database
+        # from their next reload until a full build has picked up the imported rows
+        kv = self._kv(env)
+        if kv is None:
+            return
+
+        if self._filter is not None:
+            for shortcode in shortcodes:
+                self._filter.add(shortcode)
+        await kv.put(self.stale_key, str(time.time()))
+
+    async def _list_pending(self, kv, cursor, limit):
+        if cursor:
+            try:
+                return await kv.list(prefix=self.pending_prefix, cursor=cursor, limit=limit)
+            except Exception as error:
+                console.error(f'Pending shortcode filter keys listed from the start: {error}')
+        return await kv.list(prefix=self.pending_prefix, limit=limit)
+
+    async def _fold_pending(self, kv, database, budget, published, payload, max_keys=200):
+        # isolates reload the filter every ttl seconds, a pending key may only go once the
+        # filter holding its shortcode has been published for longer than that
+        if time.time() - payload.get('published_at', 0) < self._ttl:
+            return
+
+        # at most max_keys per run, continued from the saved cursor on the next run
+        limit = min(max_keys, budget.remaining - 3)
+        if limit < 1 or not budget.take(3):
+            return
+
+        listing = await self._list_pending(kv, await kv.get(self.pending_cursor_key), limit)
+        removed = 0
+        for key in listing.keys:
+            shortcode = key.name[len(self.pending_prefix):]
+            if shortcode not in published:
+                # not folded in yet, unless the shortcode was deleted in the meantime
+                exists = await database.prepare(statements.exists).bind(shortcode).raw()
+                if exists[0][0]:
+                    continue
+            budget.take()
+            await kv.delete(key.name)
+            removed += 1
+
+        if listing.list_complete:
+            await kv.delete(self.pending_cursor_key)
+        else:
+            await kv.put(self.pending_cursor_key, listing.cursor)
+
+        if removed:
+            console.info(f'Removed {removed} pending shortcode filter keys')
+
+    async def build(self, env, budget, batch_size=1000, max_batches=100, error_rate=0.01):
+        kv = self._kv(env)
+        # the gets, puts and deletes of the filter itself, pending keys take what is left
+        if kv is None or not budget.take(6):
+            return
+
+        database = env.image_db
+        totals = await database.prepare(statements.count_shortcodes).first()
+        total = totals.count or 0
+        stale = await kv.get(self.stale_key)
+        stale = float(stale) if stale is not None else None
+        now = time.time()
+
+        bloom_filter, payload = self._parse(await kv.get(self.filter_key))
+        published = bloom_filter is not None
+        if published:
+            target_key = self.filter_key
+            await self._fold_pending(kv, database, budget, bloom_filter, payload)
+            started_at = payload.get('started_at', 0)
+            if total > bloom_filter.capacity:
+                console.info(f'Shortcode filter is over capacity ({total}), rebuilding')
+                published = False
+            elif stale is not None and stale >= started_at:
+                console.info('Shortcode filter is behind an import, rebuilding')
+                published = False
+            elif now - started_at >= self._rebuild_interval:
+                published = False
+
+        if not published:
+            target_key = self.build_key
+            bloom_filter, payload = self._parse(await kv.get(self.build_key))
+            if bloom_filter is not None and stale is not None and stale >= payload.get('started_at', 0):
+                # imported while building, rows may sit behind the cursor
+                bloom_filter = None
+            if bloom_filter is None:
+                capacity = max(total * 2, 10000)
+                bloom_filter, payload = BloomFilter.for_capacity(capacity, error_rate), {'started_at': now}
+                if total > bloom_filter.capacity:
+                    bloom_filter = BloomFilter.for_capacity(total * 2, error_rate)
+
+        cursor = payload.get('cursor', 0)
+        started_at = payload.get('started_at', now)
+        complete = False
+        for _ in range(max_batches):
+            result = await database.prepare(statements.select_shortcodes).bind(cursor, batch_size).all()
+            rows = result.results
+            for row in rows:
+                bloom_filter.add(row.shortcode)
+            if len(rows):
+                cursor = rows[len(rows) - 1].id
+            if len(rows) < batch_size:
+                complete = True
+                break
+
+        if target_key == self.build_key and complete:
+            # every row is in, publish the new filter
+            target_key = self.filter_key
+            await kv.delete(self.build_key)
+            if stale is not None and stale < started_at:
+                await kv.delete(self.stale_key)
+
+        await kv.put(target_key, bloom_filter.dumps(cursor=cursor, version=self.version, started_at=started_at,
+                                                    published_at=int(time.time())))
+        console.info(f'Shortcode filter at cursor {cursor}, {bloom_filter.count} entries'
+                     f'{"" if target_key == self.filter_key else ", build in progress"}')
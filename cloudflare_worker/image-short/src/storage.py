@@ -0,0 +1,65 @@
+import mimetypes
+
+# noinspection PyUnresolvedReferences
+from js import Headers
+# noinspection PyUnresolvedReferences
+from js import Response
+
+
+def object_key(url, img_url):
+    # only urls under RAW_IMG_BASE_URL map to a bucket key, anything else is a legacy row
+    if not url.startswith(img_url):
+        return None
+
+    return url[len(img_url):] or None
+
+
+def _content_range(r2_range, size):
+    offset = getattr(r2_range, 'offset', None)
+    length = getattr(r2_range, 'length', None)
+    suffix = getattr(r2_range, 'suffix', None)
+
+    if suffix is not None:
+        offset = max(size - suffix, 0)
+        length = size - offset
+    if offset is None:
+        offset = 0
+    if length is None:
+        length = size - offset
+
+    return f'bytes {offset}-{offset + length - 1}/{size}'
+
+
+async def fetch_object(request, bucket, key):
+    if request.method == 'HEAD':
+        r2_object = await bucket.head(key)
+    else:
+        r2_object = await bucket.get(key, onlyIf=request.headers, range=request.headers)
+
+    if r2_object is None:
+        return None
+
+    headers = Headers.new()
+    r2_object.writeHttpMetadata(headers)
+    if not headers.get('Content-Type'):
+        content_type, _ = mimetypes.guess_type(key)
+        headers.set('Content-Type', content_type or 'application/octet-stream')
+    headers.set('ETag', r2_object.httpEtag)
+    headers.set('Last-Modified', r2_object.uploaded.toUTCString())
+    headers.set('Accept-Ranges', 'bytes')
+
+    if request.method == 'HEAD':
+        headers.set('Content-Length', str(r2_object.size))
+        return Response.new(None, status=200, headers=headers)
+
+    if not hasattr(r2_object, 'body') or r2_object.body is None:
+        # a precondition failed, R2 returns the metadata without a body
+        if request.headers.get('If-Match') or request.headers.get('If-Unmodified-Since'):
+            return Response.new(None, status=412, headers=headers)
+        return Response.new(None, status=304, headers=headers)
+
+    if request.headers.get('Range') and getattr(r2_object, 'range', None) is not None:
+        headers.set('Content-Range', _content_range(r2_object.range, r2_object.size))
+        return Response.new(r2_object.body, status=206, headers=headers)
+
+    return Response.new(r2_object.body, status=200, headers=headers)
@@ -0,0 +1,23 @@
+import asyncio
+
+
+def defer(ctx, coroutine):
+    # run the coroutine after the response has been returned
+    ctx.waitUntil(asyncio.ensure_future(coroutine))
+
+
+class KVBudget:
+    # Workers KV allows 1000 operations per invocation, shared by the scheduled jobs
+    def __init__(self, operations=1000):
+        self._remaining = operations
+
+    @property
+    def remaining(self):
+        return self._remaining
+
+    def take(self, count=1):
+        if count > self._remaining:
+            return False
+
+        self._remaining -= count
+        return True
@@ -35,5 +35,6 @@ setuptools.setup(
     packages=setuptools.find_packages(),
     python_requires='>=3.6',
     install_requires=__requirements__,
+    extras_require={'s3': ['boto3>=1.34.0']},
     entry_points={'console_scripts': ['watchdog-imgshort=watchdog_imgshort.__main__:main']},
 )
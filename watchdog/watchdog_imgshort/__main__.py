@@ -1,4 +1,6 @@
+import sys
+
 from .watchdog_imgshort.__main__ import main
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -1,85 +1,169 @@
+import time
+
+STARTED = time.perf_counter()
+
 import argparse
 import logging
-import logging.handlers
-import shutil
-from pathlib import Path
+import sys
+import threading
 
 from . import __logger__
 from .config import Config
 from .file_monitor import Watchdog
 from .handlers import ImageHandler
+from .http_client import HTTPRequest
+from .log import enable_console_logging, enable_logging
+from .profiler import StartupProfiler
 
 logger = logging.getLogger(__logger__)
 
 
-def enable_logging(debug=False):
-    log_file = Path(Path().cwd(), 'debug.log')
-    global logger
+def warm_up(config, handler, watchdog, profiler, failed, report=False):
+    try:
+        with profiler.measure('validate settings'):
+            config.validate()
+    except Exception as error:
+        logger.error('Settings file failed validation: %s', error)
+        failed.set()
+        handler.cancel()
+        watchdog.stop()
+        return
 
-    def _logger_configured():
-        for _handler in logger.handlers:
-            if isinstance(_handler, logging.handlers.RotatingFileHandler):
-                return True
-        return False
+    handler.warm_up(profiler)
+    handler.ready()
+    profiler.record('ready', 0.0)
 
-    logging_format = logging.Formatter(
-        fmt='%(asctime)s.%(msecs)03d %(name)s %(levelname)s %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
+    if report:
+        logger.info('Startup profile:\n%s', profiler.report())
+
+
+def export_shortcodes(settings, parsed_args):
+    from .bulk import export_shortcodes
 
-    if not _logger_configured():
-        if log_file.is_file():
-            shutil.move(log_file, f'{log_file}.1')
+    request = HTTPRequest(settings['cloudflare']['worker_url'], settings['cloudflare']['worker_psk'])
+    if parsed_args.output == '-':
+        exported, cursor = export_shortcodes(request, sys.stdout, parsed_args.cursor, parsed_args.limit)
+    else:
+        with open(parsed_args.output, 'a' if parsed_args.cursor else 'w', encoding='utf-8') as output:
+            exported, cursor = export_shortcodes(request, output, parsed_args.cursor, parsed_args.limit)
 
-        logger.setLevel(level=logging.INFO)
-        handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=5242880, backupCount=1)
-        handler.setFormatter(logging_format)
-        logger.addHandler(handler)
+    logger.info('Export complete, %s shortcodes, cursor at %s', exported, cursor)
 
-    if debug:
-        logger.setLevel(level=logging.DEBUG)
-        handler = logging.StreamHandler()
-        handler.setFormatter(logging_format)
-        logger.addHandler(handler)
+
+def import_shortcodes(settings, parsed_args):
+    from .bulk import import_shortcodes
+
+    request = HTTPRequest(settings['cloudflare']['worker_url'], settings['cloudflare']['worker_psk'])
+    if parsed_args.input == '-':
+        written, failed = import_shortcodes(request, sys.stdin, parsed_args.rows_per_request,
+                                            parsed_args.chunk_size, parsed_args.replace)
+    else:
+        with open(parsed_args.input, 'r', encoding='utf-8') as lines:
+            written, failed = import_shortcodes(request, lines, parsed_args.rows_per_request,
+                                                parsed_args.chunk_size, parsed_args.replace)
+
+    logger.info('Import complete, %s shortcodes written, %s rejected', written, failed)
+    print(f'{written} shortcodes written, {failed} rejected', file=sys.stderr, flush=True)
+    return 1 if failed else 0
 
 
 def main():
+    profiler = StartupProfiler(started=STARTED)
+    profiler.record('module imports', profiler.elapsed())
+
     parser = argparse.ArgumentParser()
     parser.add_argument('-f', '--settings', help='Path to settings file', default='config.json')
+    parser.add_argument('--profile-startup', action='store_true', help='Report import and initialization times')
+    subparsers = parser.add_subparsers(dest='command')
+
+    export_parser = subparsers.add_parser('export', help='Export the shortcodes table as NDJSON')
+    export_parser.add_argument('-o', '--output', help='File to write to, - for stdout', default='-')
+    export_parser.add_argument('--cursor', type=int, default=0, help='Resume after this shortcode id')
+    export_parser.add_argument('--limit', type=int, default=20000, help='Shortcodes per request')
+
+    import_parser = subparsers.add_parser('import', help='Import shortcodes from NDJSON')
+    import_parser.add_argument('input', help='File to read from, - for stdin')
+    import_parser.add_argument('--rows-per-request', type=int, default=500, help='Lines sent per request')
+    import_parser.add_argument('--chunk-size', type=int, default=100, help='Rows per database batch')
+    import_parser.add_argument('--replace', action='store_true', help='Replace existing shortcodes')
+
     parsed_args = parser.parse_args()
 
-    settings = Config(parsed_args.settings).settings
+    if parsed_args.command in ('export', 'import'):
+        config = Config(parsed_args.settings)
+        enable_console_logging(debug=config.settings.get('debug', False),
+                               log_format=config.settings.get('log_format', 'text'))
+        if parsed_args.command == 'export':
+            return export_shortcodes(config.settings, parsed_args)
+        return import_shortcodes(config.settings, parsed_args)
+
+    with profiler.measure('load settings'):
+        config = Config(parsed_args.settings, validate=False)
+        settings = config.settings
+
+    with profiler.measure('enable logging'):
+        enable_logging(debug=settings.get('debug', False), log_format=settings.get('log_format', 'text'))
+
+    with profiler.measure('create handler'):
+        handler = ImageHandler(settings=settings, deferred=True)
 
-    enable_logging(debug=settings.get('debug', False))
+    watchdog = Watchdog(
+        settings['local_path'],
+        handler,
+        config=config,
+        observer_settings=settings.get('observer'),
+        on_reload=lambda _settings: enable_logging(debug=_settings.get('debug', False),
+                                                   log_format=_settings.get('log_format', 'text'))
+    )
+    with profiler.measure('start observer'):
+        watchdog.start()
+
+    # set when the deferred validation fails, the process then exits with 1 for the supervisor
+    failed = threading.Event()
+    threading.Thread(
+        target=warm_up,
+        args=(config, handler, watchdog, profiler, failed, parsed_args.profile_startup),
+        name='warm-up',
+        daemon=True
+    ).start()
+
+    storage = settings.get('storage', 'sftp')
+    if storage == 's3':
+        storage_summary = (
+            f'S3 Config:\n\t\t'
+            f'endpoint url:     {settings["s3"]["endpoint_url"]}\n\t\t'
+            f'bucket:           {settings["s3"]["bucket"]}\n\t\t'
+            f'prefix:           {settings["s3"].get("prefix", "")}\n\t'
+        )
+    else:
+        storage_summary = (
+            f'SFTP Config:\n\t\t'
+            f'host:             {settings["sftp"]["host"]}\n\t\t'
+            f'port:             {settings["sftp"]["port"]}\n\t\t'
+            f'username:         {settings["sftp"]["username"]}\n\t\t'
+            f'remote directory: {settings["sftp"]["remote_path"].rstrip("/")}\n\t'
+        )
 
     logger.info(
         f'Watchdog is running with:\n\t'
-        f'SFTP Config:\n\t\t'
-        f'host:             {settings["sftp"]["host"]}\n\t\t'
-        f'port:             {settings["sftp"]["port"]}\n\t\t'
-        f'username:         {settings["sftp"]["username"]}\n\t\t'
-        f'local directory:  {settings["sftp"]["local_path"]}\n\t\t'
-        f'remote directory: {settings["sftp"]["remote_path"].rstrip("/")}\n\t'
+        f'Local directory:          {settings["local_path"]}\n\t'
+        f'Storage:                  {storage}\n\t'
+        f'{storage_summary}'
         f'Cloudflare Config:\n\t\t'
         f'worker url:       {settings["cloudflare"]["worker_url"].rstrip("/")}\n\t'
         f'Discord Config:\n\t\t'
-        f'author:           {settings["discord"]["author"]}\n\t\t'
-        f'author icon:      {settings["discord"]["author_icon"]}\n\t\t'
-        f'embed title:      {settings["discord"]["embed_title"]}\n\t\t'
-        f'embed color:      {settings["discord"]["embed_color"]}\n\t'
-        f'Debug:                    {settings.get("debug", False)}'
+        f'author:           {settings.get("discord", {}).get("author")}\n\t\t'
+        f'author icon:      {settings.get("discord", {}).get("author_icon")}\n\t\t'
+        f'embed title:      {settings.get("discord", {}).get("embed_title")}\n\t\t'
+        f'embed color:      {settings.get("discord", {}).get("embed_color")}\n\t'
+        f'Observer:                 {settings.get("observer", {}).get("type", "native")}\n\t'
+        f'Debug:                    {settings.get("debug", False)}\n\t'
+        f'Log format:               {settings.get("log_format", "text")}'
     )
 
-    settings['sftp']['local_path'] = settings['sftp']['local_path'].replace('\\\\', '\\')
-    settings['sftp']['remote_path'] = settings['sftp']['remote_path'].rstrip('/')
-    settings["cloudflare"]['worker_url'] = settings["cloudflare"]['worker_url'].rstrip('/')
-
-    watchdog = Watchdog(
-        settings['sftp']['local_path'],
-        ImageHandler(settings=settings)
-    )
     watchdog.run()
+    return 1 if failed.is_set() else 0
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
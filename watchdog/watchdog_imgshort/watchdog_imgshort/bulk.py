@@ -0,0 +1,65 @@
+import itertools
+import json
+import logging
+
+from . import __logger__
+
+logger = logging.getLogger(__logger__)
+
+
+def export_shortcodes(request, output, cursor=0, limit=20000):
+    # pages through the worker export until the table is complete, every page resumes from the cursor
+    exported = 0
+    while True:
+        trailer = None
+        for row in request.export_shortcodes(cursor, limit):
+            if 'shortcode' not in row:
+                trailer = row
+                continue
+
+            output.write(json.dumps(row) + '\n')
+            exported += 1
+
+        if trailer is None or trailer.get('error'):
+            error = trailer.get('error') if trailer else 'incomplete response'
+            raise RuntimeError(f'Export stopped at cursor {cursor} after {exported} shortcodes: {error}')
+
+        cursor = trailer['cursor']
+        logger.info('Exported %s shortcodes, cursor at %s', exported, cursor)
+        if trailer['complete']:
+            return exported, cursor
+
+
+def import_shortcodes(request, lines, rows_per_request=500, chunk_size=100, replace=False):
+    # sent rows_per_request lines at a time, the worker writes them in D1 batches of chunk_size,
+    # lines the worker stopped before to stay within its per request limits are sent again
+    written = 0
+    failed = 0
+    offset = 0
+    # blank lines are sent as well, the worker skips them but counts them so that
+    # line numbers in the results are the file's line numbers relative to the request
+    lines = (line.strip() for line in lines)
+    while True:
+        batch = list(itertools.islice(lines, rows_per_request))
+        if not batch:
+            return written, failed
+
+        sent = len(batch)
+        for result in request.import_shortcodes(batch, chunk_size, replace):
+            if 'chunk' not in result:
+                written += result['written']
+                if result.get('stopped_at'):
+                    sent = result['stopped_at'] - 1
+                    lines = itertools.chain(batch[sent:], lines)
+                continue
+
+            for error in result['errors']:
+                failed += 1
+                logger.error('Import line %s rejected: %s', offset + error['line'], error['error'])
+            if result.get('error'):
+                failed += result['rows']
+                logger.error('Import chunk of lines %s-%s failed: %s',
+                             offset + result['first_line'], offset + result['last_line'], result['error'])
+
+        offset += sent
+        logger.info('Imported %s shortcodes, %s rejected', written, failed)
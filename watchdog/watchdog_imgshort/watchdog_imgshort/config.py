@@ -2,22 +2,25 @@ import json
 import logging
 import os
 
-from jsonschema import validate
-
 from . import __logger__
 
 logger = logging.getLogger(__logger__)
 
 
 class Config:
-    def __init__(self, config_file):
+    def __init__(self, config_file, validate=True):
         self._filename = config_file
-        self._settings = self._load()
+        self._mtime = self._get_mtime()
+        self._settings = self._load(validate=validate)
 
     @property
     def settings(self):
         return self._settings
 
+    @property
+    def changed(self):
+        return self._get_mtime() != self._mtime
+
     @property
     def schema(self):
         # noinspection HttpUrlsUsage
@@ -25,6 +28,9 @@ class Config:
             "$schema": "http://json-schema.org/schema#",
             "type": "object",
             "properties": {
+                "local_path": {
+                    "type": "string"
+                },
                 "sftp": {
                     "type": "object",
                     "properties": {
@@ -40,22 +46,62 @@ class Config:
                         "password": {
                             "type": "string"
                         },
-                        "local_path": {
-                            "type": "string"
-                        },
                         "remote_path": {
                             "type": "string"
                         }
                     },
                     "required": [
                         "host",
-                        "local_path",
                         "password",
                         "port",
                         "remote_path",
                         "username"
                     ]
                 },
+                "storage": {
+                    "type": "string",
+                    "enum": [
+                        "sftp",
+                        "s3"
+                    ]
+                },
+                "s3": {
+                    "type": "object",
+                    "properties": {
+                        "endpoint_url": {
+                            "type": "string"
+                        },
+                        "bucket": {
+                            "type": "string"
+                        },
+                        "access_key": {
+                            "type": "string"
+                        },
+                        "secret_key": {
+                            "type": "string"
+                        },
+                        "region": {
+                            "type": "string"
+                        },
+                        "prefix": {
+                            "type": "string"
+                        },
+                        "part_size": {
+                            "type": "integer",
+                            "minimum": 5242880
+                        },
+                        "concurrency": {
+                            "type": "integer",
+                            "minimum": 1
+                        }
+                    },
+                    "required": [
+                        "access_key",
+                        "bucket",
+                        "endpoint_url",
+                        "secret_key"
+                    ]
+                },
                 "cloudflare": {
                     "type": "object",
                     "properties": {
@@ -64,6 +110,14 @@ class Config:
                         },
                         "worker_psk": {
                             "type": "string"
+                        },
+                        "expires_in": {
+                            "type": "integer",
+                            "minimum": 0
+                        },
+                        "purge_interval": {
+                            "type": "number",
+                            "minimum": 0
                         }
                     },
                     "required": [
@@ -88,31 +142,223 @@ class Config:
                         },
                         "embed_color": {
                             "type": "string"
+                        },
+                        "timeout": {
+                            "type": "number",
+                            "exclusiveMinimum": 0
                         }
                     },
                     "required": [
                         "webhook"
                     ]
                 },
+                "notifiers": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "type": {
+                                "type": "string"
+                            },
+                            "enabled": {
+                                "type": "boolean"
+                            },
+                            "timeout": {
+                                "type": "number",
+                                "exclusiveMinimum": 0
+                            }
+                        },
+                        "required": [
+                            "type"
+                        ]
+                    }
+                },
+                "notifier_workers": {
+                    "type": "integer",
+                    "minimum": 1
+                },
+                "optimizer": {
+                    "type": "object",
+                    "properties": {
+                        "enabled": {
+                            "type": "boolean"
+                        },
+                        "cache_path": {
+                            "type": "string"
+                        },
+                        "workers": {
+                            "type": "integer",
+                            "minimum": 1
+                        },
+                        "cache_size": {
+                            "type": "integer",
+                            "minimum": 0
+                        },
+                        "thresholds": {
+                            "type": "object",
+                            "additionalProperties": {
+                                "type": "integer",
+                                "minimum": 0
+                            }
+                        }
+                    }
+                },
+                "scheduler": {
+                    "type": "object",
+                    "properties": {
+                        "workers": {
+                            "type": "integer",
+                            "minimum": 1
+                        },
+                        "large_threshold": {
+                            "type": "integer",
+                            "minimum": 0
+                        },
+                        "large_share": {
+                            "type": "number",
+                            "exclusiveMinimum": 0,
+                            "maximum": 1
+                        },
+                        "aging_seconds": {
+                            "type": "number",
+                            "exclusiveMinimum": 0
+                        },
+                        "max_wait_seconds": {
+                            "type": "number",
+                            "minimum": 0
+                        }
+                    }
+                },
+                "observer": {
+                    "type": "object",
+                    "properties": {
+                        "type": {
+                            "type": "string",
+                            "enum": [
+                                "native",
+                                "polling"
+                            ]
+                        },
+                        "interval": {
+                            "type": "number",
+                            "exclusiveMinimum": 0
+                        },
+                        "full_scan_every": {
+                            "type": "integer",
+                            "minimum": 1
+                        },
+                        "settle_seconds": {
+                            "type": "number",
+                            "minimum": 0
+                        },
+                        "snapshot": {
+                            "type": "string"
+                        }
+                    }
+                },
                 "debug": {
                     "type": "boolean"
+                },
+                "log_format": {
+                    "type": "string",
+                    "enum": [
+                        "text",
+                        "json"
+                    ]
                 }
             },
             "required": [
                 "cloudflare",
-                "sftp"
-            ]
+                "local_path"
+            ],
+            # the section of the storage in use is required, sftp when storage is not set
+            "if": {
+                "properties": {
+                    "storage": {
+                        "const": "s3"
+                    }
+                },
+                "required": [
+                    "storage"
+                ]
+            },
+            "then": {
+                "required": [
+                    "s3"
+                ]
+            },
+            "else": {
+                "required": [
+                    "sftp"
+                ]
+            }
         }
 
     def _validate(self, data):
+        from jsonschema import validate
         validate(data, self.schema)
 
-    def _load(self):
+    def validate(self):
+        self._validate(self._settings)
+
+    def _get_mtime(self):
+        try:
+            return os.stat(self._filename).st_mtime_ns
+        except OSError:
+            return None
+
+    @staticmethod
+    def _upgrade(payload):
+        # local_path used to be part of the sftp section
+        sftp = payload.get('sftp')
+        if 'local_path' not in payload and isinstance(sftp, dict) and 'local_path' in sftp:
+            payload['local_path'] = sftp.pop('local_path')
+        return payload
+
+    @staticmethod
+    def _normalize(payload):
+        payload['local_path'] = payload['local_path'].replace('\\\\', '\\')
+        if 'sftp' in payload:
+            payload['sftp']['remote_path'] = payload['sftp'].get('remote_path', '').rstrip('/')
+        payload['cloudflare']['worker_url'] = payload['cloudflare']['worker_url'].rstrip('/')
+        return payload
+
+    def _load(self, validate=True):
         if not os.path.isfile(self._filename):
             raise FileNotFoundError(f'Settings file does not exist. "{self._filename}"')
 
         with open(self._filename, 'r') as _file:
-            payload = json.load(_file)
+            payload = self._upgrade(json.load(_file))
 
-        self._validate(payload)
-        return payload
+        if validate:
+            self._validate(payload)
+        else:
+            # full schema validation is deferred, only check what is needed to start watching
+            if not isinstance(payload.get('local_path'), str):
+                raise ValueError(f'Settings file is missing "local_path". "{self._filename}"')
+
+            storage = payload.get('storage', 'sftp')
+            if storage not in self.schema['properties']['storage']['enum']:
+                raise ValueError(f'Settings file has an unknown storage "{storage}". "{self._filename}"')
+
+            for section in ('cloudflare', storage):
+                if not isinstance(payload.get(section), dict):
+                    raise ValueError(f'Settings file is missing "{section}". "{self._filename}"')
+            for key in self.schema['properties'][storage]['required']:
+                if key not in payload[storage]:
+                    raise ValueError(f'Settings file is missing "{storage}.{key}". "{self._filename}"')
+        return self._normalize(payload)
+
+    def reload(self):
+        from jsonschema import ValidationError
+
+        self._mtime = self._get_mtime()
+        try:
+            settings = self._load()
+        except (OSError, ValueError, ValidationError) as error:
+            logger.error('Settings file "%s" failed to reload, keeping current settings: %s', self._filename, error)
+            return False
+
+        self._settings = settings
+        logger.info('Settings reloaded from "%s"', self._filename)
+        return True
@@ -1,5 +1,6 @@
 import logging
-import time
+import signal
+import threading
 
 from watchdog.observers import Observer
 
@@ -8,23 +9,88 @@ from . import __logger__
 logger = logging.getLogger(__logger__)
 
 
+def create_observer(observer_settings=None):
+    observer_settings = observer_settings or {}
+    if observer_settings.get('type', 'native') != 'polling':
+        return Observer()
+
+    from .polling import ScandirObserver
+
+    return ScandirObserver(
+        interval=observer_settings.get('interval', 2.0),
+        snapshot_file=observer_settings.get('snapshot'),
+        full_scan_every=observer_settings.get('full_scan_every', 30),
+        settle_seconds=observer_settings.get('settle_seconds', 10.0)
+    )
+
+
 class Watchdog:
 
-    def __init__(self, directory, handler):
-        self._observer = Observer()
+    def __init__(self, directory, handler, config=None, on_reload=None, observer_settings=None):
+        self._observer_settings = observer_settings
+        self._observer = create_observer(observer_settings)
         self._handler = handler
         self._directory = directory
+        self._config = config
+        self._on_reload = on_reload
+        self._reload_requested = False
+        self._started = False
+        self._stopped = threading.Event()
+
+    def _request_reload(self, *_args):
+        self._reload_requested = True
+
+    def _reload(self):
+        self._reload_requested = False
+        if not self._config.reload():
+            return
+
+        settings = self._config.settings
+        self._handler.apply_settings(settings)
+
+        if settings.get('observer') != self._observer_settings:
+            logger.warning('Observer settings changed, restart to apply them')
+
+        directory = settings['local_path']
+        if directory != self._directory:
+            logger.info('Watching %s instead of %s', directory, self._directory)
+            self._observer.unschedule_all()
+            self._directory = directory
+            self._observer.schedule(
+                self._handler, self._directory, recursive=False
+            )
+
+        if self._on_reload is not None:
+            self._on_reload(settings)
+
+    def start(self):
+        if self._started:
+            return
 
-    def run(self):
         self._observer.schedule(
             self._handler, self._directory, recursive=False
         )
         self._observer.start()
-        logger.debug(f'Observer Running in {self._directory}')
+        self._started = True
+        logger.debug('Observer Running in %s', self._directory)
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        if self._config is not None and hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, self._request_reload)
+
+        self.start()
         try:
-            while True:
-                time.sleep(1)
+            while not self._stopped.wait(1):
+                if self._config is not None and (self._reload_requested or self._config.changed):
+                    self._reload()
         except KeyboardInterrupt:
-            self._observer.stop()
+            pass
+        self._observer.stop()
         self._observer.join()
         logger.debug('Observer Terminated')
+
+        if hasattr(self._handler, 'shutdown'):
+            self._handler.shutdown()
@@ -1,20 +1,27 @@
-import hashlib
+import concurrent.futures
+import importlib
 import logging
+import os
+import threading
 from pathlib import Path
 
-import shortuuid
 from watchdog.events import PatternMatchingEventHandler
 
 from . import __logger__
 from .http_client import HTTPRequest
-from .notifiers.discord import Discord
-from .sftp_client import SFTP
+from .log import clear_event_id, new_event_id
+from .notifiers import notifier_class
+from .notifiers.dispatcher import NotifierDispatcher
+from .optimizer import Optimizer
+from .profiler import StartupProfiler
+from .scheduler import UploadScheduler
+from .storage.base import StoragePool
 
 logger = logging.getLogger(__logger__)
 
 
 class ImageHandler(PatternMatchingEventHandler):
-    def __init__(self, settings):
+    def __init__(self, settings, deferred=False):
         self._settings = settings
         super(ImageHandler, self).__init__(
             patterns=['*.webp', '*.jpg', '*.jpeg', '*.png', '*.apng', '*.gif', '*.svg',
@@ -22,22 +29,154 @@ class ImageHandler(PatternMatchingEventHandler):
             ignore_directories=True
         )
 
-        self._sftp = SFTP(
+        self._lock = threading.RLock()
+        self._ready = threading.Event()
+        self._stopped = threading.Event()
+        self._cancelled = False
+        if not deferred:
+            self._ready.set()
+
+        self._storage = StoragePool(self._create_storage)
+        self._request = self._create_request()
+        self._optimizer = self._create_optimizer()
+        self._scheduler = self._create_scheduler()
+        self._notifiers = None
+        self._dispatcher = NotifierDispatcher(self._settings.get('notifier_workers', 4))
+
+        self._purging = None
+        self._start_purging()
+
+    @property
+    def _storage_type(self):
+        return self._settings.get('storage', 'sftp')
+
+    @property
+    def _remote_path(self):
+        if self._storage_type == 's3':
+            return self._settings['s3'].get('prefix', '')
+        return self._settings['sftp']['remote_path']
+
+    def _create_storage(self):
+        if self._storage_type == 's3':
+            from .storage.s3 import S3
+
+            return S3(
+                endpoint_url=self._settings['s3']['endpoint_url'],
+                bucket=self._settings['s3']['bucket'],
+                access_key=self._settings['s3']['access_key'],
+                secret_key=self._settings['s3']['secret_key'],
+                region=self._settings['s3'].get('region', 'auto'),
+                part_size=self._settings['s3'].get('part_size', 8388608),
+                concurrency=self._settings['s3'].get('concurrency', 4)
+            )
+
+        from .storage.sftp import SFTP
+
+        return SFTP(
             host=self._settings['sftp']['host'],
             user=self._settings['sftp']['username'],
             password=self._settings['sftp']['password'],
             port=self._settings['sftp']['port']
         )
 
-        self._request = HTTPRequest(self._settings['cloudflare']['worker_url'],
-                                    self._settings['cloudflare']['worker_psk'])
+    def _create_request(self):
+        return HTTPRequest(self._settings['cloudflare']['worker_url'],
+                           self._settings['cloudflare']['worker_psk'])
+
+    def _create_optimizer(self):
+        if not self._settings.get('optimizer', {}).get('enabled', False):
+            return None
+
+        return Optimizer(
+            self._settings['optimizer'].get('cache_path', 'optimized'),
+            self._settings['optimizer'].get('thresholds'),
+            self._settings['optimizer'].get('workers'),
+            self._settings['optimizer'].get('cache_size', 1073741824)
+        )
+
+    def _create_scheduler(self):
+        return UploadScheduler(
+            workers=self._settings.get('scheduler', {}).get('workers', 4),
+            large_threshold=self._settings.get('scheduler', {}).get('large_threshold', 16777216),
+            large_share=self._settings.get('scheduler', {}).get('large_share', 0.5),
+            aging_seconds=self._settings.get('scheduler', {}).get('aging_seconds', 30.0),
+            max_wait_seconds=self._settings.get('scheduler', {}).get('max_wait_seconds', 300.0)
+        )
 
-        self._notifiers = []
+    @property
+    def scheduler(self):
+        return self._scheduler
+
+    def warm_up(self, profiler=None):
+        # import the heavy dependencies and connect while the observer is already queueing events
+        profiler = profiler or StartupProfiler()
+        storage_module = 'boto3' if self._storage_type == 's3' else 'paramiko'
+        for module in ('shortuuid', storage_module, 'discord_webhook'):
+            with profiler.measure(f'import {module}'):
+                try:
+                    importlib.import_module(module)
+                except ImportError as error:
+                    logger.error('Failed to import %s: %s', module, error)
+
+        with profiler.measure(f'{self._storage_type} connect'):
+            try:
+                with self._storage.client() as storage:
+                    storage.connect()
+            except Exception as error:
+                logger.error('Storage warm up connection failed: %s', error)
+
+    def ready(self):
+        self._ready.set()
+
+    def cancel(self):
+        self._cancelled = True
+        self._ready.set()
+
+    def apply_settings(self, settings):
+        # running jobs finish with the components they hold, later ones use the new ones
+        with self._lock:
+            old_settings = self._settings
+            self._settings = settings
+
+            sftp_keys = ('host', 'port', 'username', 'password')
+            if (old_settings.get('storage', 'sftp') != settings.get('storage', 'sftp') or
+                    old_settings.get('s3') != settings.get('s3') or
+                    any(old_settings.get('sftp', {}).get(key) != settings.get('sftp', {}).get(key)
+                        for key in sftp_keys)):
+                logger.info('Storage settings changed, reconnecting')
+                self._storage.close()
+                self._storage = StoragePool(self._create_storage)
+
+            if old_settings['cloudflare'] != settings['cloudflare']:
+                logger.info('Cloudflare settings changed')
+                self._request = self._create_request()
+                self._start_purging()
+
+            if old_settings.get('optimizer') != settings.get('optimizer'):
+                logger.info('Optimizer settings changed')
+                self._optimizer = self._create_optimizer()
+
+            if (old_settings.get('discord') != settings.get('discord') or
+                    old_settings.get('notifiers') != settings.get('notifiers')):
+                logger.info('Notifier settings changed')
+                self._notifiers = None
+
+            if old_settings.get('scheduler') != settings.get('scheduler'):
+                logger.warning('Scheduler settings changed, restart to apply them')
 
     @staticmethod
     def _generate_shortcode():
+        import shortuuid
+
         return shortuuid.uuid()[:8]
 
+    def _shortcode_data(self, shortcode, filename):
+        data = {'shortcode': shortcode, 'image': filename}
+        expires_in = self._settings['cloudflare'].get('expires_in')
+        if expires_in:
+            data['expires_in'] = expires_in
+        return data
+
     def _get_shortcode(self, filename_and_path):
         data = self._request.POST({'shortcode': Path(filename_and_path).name})
         if not data:
@@ -45,84 +184,119 @@ class ImageHandler(PatternMatchingEventHandler):
 
         shortcode = data.get('shortcode')
         if not shortcode:
-            logger.error(f'No shortcode for {filename_and_path}')
+            logger.error('No shortcode for %s', filename_and_path)
             return None
 
         return shortcode
 
-    def _enabled_notifier(self, notifier_class):
-        for notifier in self._notifiers:
-            if isinstance(notifier, notifier_class):
-                return True
-        return False
+    def _upload(self, filename):
+        upload_filename = filename
+        if self._optimizer is not None:
+            upload_filename = self._optimizer.optimize(filename)
+
+        with self._storage.client() as storage:
+            storage.put(upload_filename, self._remote_path, remote_name=Path(filename).name)
+
+    def _notifier_settings(self):
+        # the discord section predates the notifiers list and is kept working
+        if 'webhook' in self._settings.get('discord', {}):
+            yield 'discord', self._settings['discord']
+
+        for settings in self._settings.get('notifiers', []):
+            if settings.get('enabled', True):
+                yield settings['type'], settings
 
     def _enable_notifiers(self):
-        if 'discord' in self._settings and 'webhook' in self._settings['discord']:
-            if not self._enabled_notifier(Discord):
-                self._notifiers.append(
-                    Discord(
-                        self._settings['discord']['webhook'],
-                        self._settings['discord'].get('author', 'Shortcode Notifier'),
-                        self._settings['discord'].get('author_icon'),
-                        self._settings['discord'].get('embed_title', 'Shortcode Update'),
-                        self._settings['discord'].get('embed_color', '03b2f8')
-                    )
-                )
+        with self._lock:
+            if self._notifiers is not None:
+                return self._notifiers
+
+            notifiers = []
+            for notifier_type, settings in self._notifier_settings():
+                try:
+                    notifiers.append(notifier_class(notifier_type).from_settings(settings))
+                except Exception as error:
+                    logger.error('Failed to enable %s notifier: %s', notifier_type, error)
+
+            self._notifiers = notifiers
+            return notifiers
 
     def _send_notifications(self, shortcode, shortcode_url, filename):
-        self._enable_notifiers()
-        for notifier in self._notifiers:
-            notifier.notify(
-                shortcode,
-                shortcode_url,
-                filename,
-                notifier.description(shortcode, shortcode_url)
-            )
+        def notify(notifier):
+            notifier.notify(shortcode, shortcode_url, filename, notifier.description(shortcode, shortcode_url))
+
+        self._dispatcher.dispatch(self._enable_notifiers(), 'notify', shortcode, notify)
 
     def _edit_notifications(self, shortcode, shortcode_url, filename):
-        self._enable_notifiers()
-        for notifier in self._notifiers:
-            notifier.edit(
-                shortcode,
-                shortcode_url,
-                filename,
-                notifier.description(shortcode, shortcode_url)
-            )
+        def edit(notifier):
+            notifier.edit(shortcode, shortcode_url, filename, notifier.description(shortcode, shortcode_url))
+
+        self._dispatcher.dispatch(self._enable_notifiers(), 'edit', shortcode, edit)
 
     def _delete_notifications(self, shortcode):
-        self._enable_notifiers()
-        for notifier in self._notifiers:
+        def delete(notifier):
             notifier.delete(shortcode)
 
+        self._dispatcher.dispatch(self._enable_notifiers(), 'delete', shortcode, delete)
+
     def on_any_event(self, event):
         if event.is_directory:
             return
 
-        event_hash = hashlib.md5(event.__str__().encode('utf-8')).hexdigest()
-        logger.debug(f'File event occurred:\n\tevent: {event}\n\thash: {event_hash}')
+        self._ready.wait()
+        if self._cancelled:
+            return
+
+        if event.event_type not in ('modified', 'moved', 'deleted'):
+            return
+
+        keys = [Path(event.src_path).name]
+        size = 0
+        if event.event_type == 'moved':
+            keys.append(Path(event.dest_path).name)
+            size = self._file_size(event.dest_path)
+        elif event.event_type == 'modified':
+            size = self._file_size(event.src_path)
+
+        event_id = new_event_id()
+        try:
+            # the event id is carried into the job with the context
+            self._scheduler.submit(keys, size, self._on_any_event, event, event_id)
+        finally:
+            clear_event_id()
+
+    @staticmethod
+    def _file_size(filename):
+        try:
+            return os.path.getsize(filename)
+        except OSError:
+            return 0
+
+    def _on_any_event(self, event, event_id):
+        logger.debug('File event occurred:\n\tevent: %s\n\tid: %s', event, event_id)
 
         if event.event_type == 'modified':
             shortcode = self._get_shortcode(event.src_path)
             filename = Path(event.src_path).name
 
             if not shortcode:
-                logger.debug(f'No shortcode for {event.src_path}')
+                logger.debug('No shortcode for %s', event.src_path)
                 shortcode = self._generate_shortcode()
                 shortcode_url = '/'.join([self._settings['cloudflare']['worker_url'], shortcode])
 
-                self._request.POST({'shortcode': shortcode, 'image': filename})
-                self._sftp.put(event.src_path, self._settings['sftp']['remote_path'])
-                logger.info(f'{filename} is uploaded to {shortcode_url}')
+                self._request.POST(self._shortcode_data(shortcode, filename))
+                self._upload(event.src_path)
+                logger.info('%s is uploaded to %s', filename, shortcode_url)
 
-                logger.info(f'Sending notifications')
+                logger.info('Sending notifications')
                 self._send_notifications(shortcode, shortcode_url, filename)
 
             else:
                 shortcode_url = '/'.join([self._settings['cloudflare']['worker_url'], shortcode])
 
                 self._request.PUT({'shortcode': shortcode, 'image': Path(event.src_path).name})
-                self._sftp.put(event.src_path, self._settings['sftp']['remote_path'])
-                logger.info(f'{filename} is uploaded to {shortcode_url}')
+                self._upload(event.src_path)
+                logger.info('%s is uploaded to %s', filename, shortcode_url)
 
         elif event.event_type == 'moved':
             shortcode = self._get_shortcode(event.src_path)
@@ -130,37 +304,113 @@ class ImageHandler(PatternMatchingEventHandler):
             old_filename = Path(event.src_path).name
 
             if not shortcode:
-                logger.debug(f'No shortcode for {event.src_path}')
+                logger.debug('No shortcode for %s', event.src_path)
                 shortcode = self._generate_shortcode()
                 shortcode_url = '/'.join([self._settings['cloudflare']['worker_url'], shortcode])
 
-                self._request.POST({'shortcode': shortcode, 'image': filename})
-                self._sftp.put(event.dest_path, self._settings['sftp']['remote_path'])
-                logger.info(f'{filename} is uploaded to {shortcode_url}')
+                self._request.POST(self._shortcode_data(shortcode, filename))
+                self._upload(event.dest_path)
+                logger.info('%s is uploaded to %s', filename, shortcode_url)
 
-                logger.info(f'Sending notifications')
+                logger.info('Sending notifications')
                 self._send_notifications(shortcode, shortcode_url, filename)
             else:
                 shortcode_url = '/'.join([self._settings['cloudflare']['worker_url'], shortcode])
 
                 self._request.PUT({'shortcode': shortcode, 'image': filename})
-                self._sftp.rename(event.src_path, event.dest_path, self._settings['sftp']['remote_path'])
-                logger.info(f'Moved {old_filename} to {filename}')
+                with self._storage.client() as storage:
+                    storage.rename(event.src_path, event.dest_path, self._remote_path)
+                logger.info('Moved %s to %s', old_filename, filename)
 
-                logger.info(f'Editing notifications')
+                logger.info('Editing notifications')
                 self._edit_notifications(shortcode, shortcode_url, filename)
 
         elif event.event_type == 'deleted':
             shortcode = self._get_shortcode(event.src_path)
             if shortcode:
                 self._request.DELETE(shortcode)
-                self._sftp.remove(event.src_path, self._settings['sftp']['remote_path'])
-                logger.info(f'Deleted {Path(event.src_path).name}')
+                with self._storage.client() as storage:
+                    storage.remove(event.src_path, self._remote_path)
+                logger.info('Deleted %s', Path(event.src_path).name)
 
-                logger.info(f'Deleting notifications')
+                logger.info('Deleting notifications')
                 self._delete_notifications(shortcode)
 
-        logger.debug(f'Response to file event completed.\n\thash: {event_hash}')
+        logger.debug('Response to file event completed.\n\tid: %s', event_id)
+
+    def _start_purging(self):
+        # shortcodes only expire when they are created with expires_in
+        with self._lock:
+            if self._purging is not None or not self._settings['cloudflare'].get('expires_in'):
+                return
+
+            self._purging = threading.Thread(target=self._purge_expired_loop, name='purge-expired', daemon=True)
+            self._purging.start()
+
+    def _purge_expired_loop(self):
+        self._ready.wait()
+        while not self._cancelled:
+            with self._lock:
+                if not self._settings['cloudflare'].get('expires_in'):
+                    self._purging = None
+                    return
+
+            interval = self._settings['cloudflare'].get('purge_interval', 900)
+            if self._stopped.wait(interval or 60):
+                return
+
+            if interval:
+                try:
+                    self.purge_expired()
+                except Exception as error:
+                    logger.error('Failed to purge expired images: %s', error)
+
+    def purge_expired(self, limit=500):
+        # removes the images of shortcodes purged by the worker, a page at a time
+        while not self._stopped.is_set():
+            keys = [entry['key'] for entry in self._request.expired_keys(limit)]
+            if not keys:
+                return
+
+            # queued with the file events so an upload of the same file is not raced
+            future = concurrent.futures.Future()
+            self._scheduler.submit(keys, 0, self._remove_expired, keys, future)
+            while True:
+                try:
+                    failed = future.result(timeout=1)
+                    break
+                except concurrent.futures.TimeoutError:
+                    if self._stopped.is_set():
+                        return
+
+            # keys that failed to be removed are listed again, they are retried on the next run
+            if len(keys) < limit or failed == len(keys):
+                return
+
+    def _remove_expired(self, keys, future):
+        try:
+            # a key may have been taken up again since it was listed
+            purgeable = self._request.purgeable_keys(keys)
+            removed = set()
+            if purgeable:
+                with self._storage.client() as storage:
+                    removed = storage.remove_many(purgeable, self._remote_path)
+            if removed:
+                self._request.acknowledge_expired(sorted(removed))
+            logger.info('Removed %s of %s expired images', len(removed), len(purgeable))
+            future.set_result(len(purgeable) - len(removed))
+        except Exception as error:
+            future.set_exception(error)
+
+    def shutdown(self):
+        # finish the queued jobs before disconnecting
+        self._stopped.set()
+        self._scheduler.shutdown(wait=True)
+        self._dispatcher.shutdown(wait=True)
+        self._storage.disconnect()
 
     def __del__(self):
-        self._sftp.disconnect()
+        self._stopped.set()
+        self._scheduler.shutdown(wait=False)
+        self._dispatcher.shutdown(wait=False)
+        self._storage.disconnect()
@@ -30,15 +30,15 @@ class HTTPRequest:
         request.add_header('Referrer', self._worker_url)
         request.add_header('User-Agent', self._user_agent)
 
-        logger.debug(f'POST request: {data.decode("utf-8")}')
+        logger.debug('POST request: %s', data)
         with urlopen(request) as response:
             status_code = response.status
             if status_code == 200 and 'application/json' in response.headers.get('Content-Type'):
                 payload = json.loads(response.read().decode('utf-8'))
-                logger.debug(f'POST response: {payload}')
+                logger.debug('POST response: %s', payload)
                 return payload
 
-        logger.debug(f'POST response: {status_code}')
+        logger.debug('POST response: %s', status_code)
         return None
 
     def PUT(self, data):
@@ -49,9 +49,9 @@ class HTTPRequest:
         request.add_header('Referrer', self._worker_url)
         request.add_header('User-Agent', self._user_agent)
 
-        logger.debug(f'PUT request: {data.decode("utf-8")}')
+        logger.debug('PUT request: %s', data)
         with urlopen(request) as response:
-            logger.debug(f'PUT response: {response.status}')
+            logger.debug('PUT response: %s', response.status)
 
     def DELETE(self, shortcode):
         request = Request(f'{self._worker_url}/{shortcode}', method='DELETE')
@@ -59,6 +59,69 @@ class HTTPRequest:
         request.add_header('Referrer', self._worker_url)
         request.add_header('User-Agent', self._user_agent)
 
-        logger.debug(f'DELETE request: {shortcode}')
+        logger.debug('DELETE request: %s', shortcode)
         with urlopen(request) as response:
-            logger.debug(f'DELETE response: {response.status}')
+            logger.debug('DELETE response: %s', response.status)
+
+    def export_shortcodes(self, cursor=0, limit=20000):
+        request = Request(f'{self._worker_url}/shortcodes/export?cursor={cursor}&limit={limit}', method='GET')
+        request.add_header(self._auth_header, self._worker_psk)
+        request.add_header('Referrer', self._worker_url)
+        request.add_header('User-Agent', self._user_agent)
+
+        logger.debug('Export request from cursor %s', cursor)
+        with urlopen(request) as response:
+            # streamed, one shortcode per line and the cursor to continue from on the last
+            for line in response:
+                line = line.strip()
+                if line:
+                    yield json.loads(line.decode('utf-8'))
+
+    def import_shortcodes(self, lines, chunk_size=100, replace=False):
+        data = ''.join(f'{line}\n' for line in lines).encode('utf-8')
+        request = Request(f'{self._worker_url}/shortcodes/import?chunk={chunk_size}&replace={int(replace)}',
+                          data=data, method='POST')
+        request.add_header(self._auth_header, self._worker_psk)
+        request.add_header('Content-Type', 'application/x-ndjson')
+        request.add_header('Referrer', self._worker_url)
+        request.add_header('User-Agent', self._user_agent)
+
+        logger.debug('Import request: %s bytes', len(data))
+        with urlopen(request) as response:
+            return [json.loads(line.decode('utf-8')) for line in response if line.strip()]
+
+    def expired_keys(self, limit=500):
+        request = Request(f'{self._worker_url}/expired/keys?limit={limit}', method='GET')
+        request.add_header(self._auth_header, self._worker_psk)
+        request.add_header('Referrer', self._worker_url)
+        request.add_header('User-Agent', self._user_agent)
+
+        with urlopen(request) as response:
+            payload = json.loads(response.read().decode('utf-8'))
+            logger.debug('Expired keys response: %s, %s keys', response.status, len(payload['keys']))
+            return payload['keys']
+
+    def purgeable_keys(self, keys):
+        data = self._encode_request_data({'keys': keys})
+        request = Request(f'{self._worker_url}/expired/keys/check', data=data, method='POST')
+        request.add_header(self._auth_header, self._worker_psk)
+        request.add_header('Content-Type', 'application/json')
+        request.add_header('Referrer', self._worker_url)
+        request.add_header('User-Agent', self._user_agent)
+
+        with urlopen(request) as response:
+            payload = json.loads(response.read().decode('utf-8'))
+            logger.debug('Purgeable keys response: %s, %s of %s keys', response.status, len(payload['keys']),
+                         len(keys))
+            return payload['keys']
+
+    def acknowledge_expired(self, keys):
+        data = self._encode_request_data({'keys': keys})
+        request = Request(f'{self._worker_url}/expired/keys', data=data, method='POST')
+        request.add_header(self._auth_header, self._worker_psk)
+        request.add_header('Content-Type', 'application/json')
+        request.add_header('Referrer', self._worker_url)
+        request.add_header('User-Agent', self._user_agent)
+
+        with urlopen(request) as response:
+            logger.debug('Expired keys acknowledged: %s', response.status)
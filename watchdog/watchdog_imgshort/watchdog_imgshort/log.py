@@ -0,0 +1,119 @@
+import atexit
+import contextvars
+import copy
+import itertools
+import json
+import logging
+import logging.handlers
+import queue
+import shutil
+from pathlib import Path
+
+from . import __logger__
+
+logger = logging.getLogger(__logger__)
+
+_event_id = contextvars.ContextVar('event_id', default=None)
+_event_counter = itertools.count(1)
+
+_listener = None
+_stream_handler = None
+
+
+def new_event_id():
+    event_id = f'{next(_event_counter):x}'
+    _event_id.set(event_id)
+    return event_id
+
+
+def clear_event_id():
+    _event_id.set(None)
+
+
+class EventIdFilter(logging.Filter):
+    # runs in the logging thread, before the record is queued
+    def filter(self, record):
+        record.event_id = _event_id.get()
+        return True
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    # the default prepare merges the traceback into the message and drops it,
+    # keep it in exc_text so each formatter can place it
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        payload = {
+            'time': self.formatTime(record, self.datefmt),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'event_id': getattr(record, 'event_id', None),
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            payload['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload['exception'] = record.exc_text
+        return json.dumps(payload)
+
+
+def _get_formatter(log_format):
+    if log_format == 'json':
+        return JSONFormatter(datefmt='%Y-%m-%dT%H:%M:%S%z')
+
+    return logging.Formatter(
+        fmt='%(asctime)s.%(msecs)03d %(name)s %(levelname)s %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+
+def enable_logging(debug=False, log_format='text'):
+    global _listener
+    global _stream_handler
+
+    formatter = _get_formatter(log_format)
+
+    if _listener is None:
+        log_file = Path(Path().cwd(), 'debug.log')
+        if log_file.is_file():
+            shutil.move(log_file, f'{log_file}.1')
+
+        file_handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=5242880, backupCount=1)
+        _stream_handler = logging.StreamHandler()
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = QueueHandler(log_queue)
+        queue_handler.addFilter(EventIdFilter())
+        logger.addHandler(queue_handler)
+
+        _listener = logging.handlers.QueueListener(log_queue, file_handler, _stream_handler,
+                                                   respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+    for handler in _listener.handlers:
+        handler.setFormatter(formatter)
+
+    # the stream handler only outputs in debug
+    _stream_handler.setLevel(logging.DEBUG if debug else logging.CRITICAL + 1)
+    logger.setLevel(logging.DEBUG if debug else logging.INFO)
+
+
+def enable_console_logging(debug=False, log_format='text'):
+    # for the export and import commands, the debug.log of a running watchdog is left alone
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(_get_formatter(log_format))
+    stream_handler.addFilter(EventIdFilter())
+    logger.addHandler(stream_handler)
+    logger.setLevel(logging.DEBUG if debug else logging.INFO)
@@ -0,0 +1,22 @@
+import importlib
+
+# notifier types usable in the "notifiers" settings, a type can also be given
+# as "package.module:Class" for notifiers living outside this package
+_registry = {
+    'discord': '.discord:Discord',
+    'webhook': '.webhook:Webhook',
+}
+
+
+def register(notifier_type, path):
+    _registry[notifier_type] = path
+
+
+def notifier_class(notifier_type):
+    path = _registry.get(notifier_type, notifier_type)
+    if ':' not in path:
+        raise ValueError(f'Unknown notifier type "{notifier_type}"')
+
+    module_name, class_name = path.split(':', 1)
+    module = importlib.import_module(module_name, package=__name__)
+    return getattr(module, class_name)
@@ -3,8 +3,22 @@ import os
 
 
 class BaseNotifier:
-    @staticmethod
-    def description(shortcode, shortcode_url):
+    def __init__(self, timeout=10.0):
+        self._timeout = timeout
+
+    @classmethod
+    def from_settings(cls, settings):
+        raise NotImplementedError
+
+    @property
+    def label(self):
+        return type(self).__name__
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+    def description(self, shortcode, shortcode_url):
         return f'Shortcode "{shortcode}" created for filename, and is now available at {shortcode_url}'
 
     @staticmethod
@@ -21,10 +35,10 @@ class BaseNotifier:
             json.dump(data, _file)
 
     def notify(self, shortcode, image_url, image_filename, description):
-        raise NotImplemented
+        raise NotImplementedError
 
     def edit(self, shortcode, image_url, image_filename, description):
-        raise NotImplemented
+        raise NotImplementedError
 
     def delete(self, shortcode):
-        raise NotImplemented
+        raise NotImplementedError
@@ -1,6 +1,5 @@
 import logging
-
-from discord_webhook import DiscordWebhook, DiscordEmbed
+import threading
 
 from .base import BaseNotifier
 from .. import __logger__
@@ -9,7 +8,8 @@ logger = logging.getLogger(__logger__)
 
 
 class Discord(BaseNotifier):
-    def __init__(self, webhook, author, author_icon, embed_title, embed_color):
+    def __init__(self, webhook, author, author_icon, embed_title, embed_color, timeout=10.0):
+        super(Discord, self).__init__(timeout)
         self._url = webhook
         self._name = author
         self._icon = author_icon
@@ -17,6 +17,18 @@ class Discord(BaseNotifier):
         self._color = embed_color
         self._id_file = 'webhook_ids.json'
         self._webhook_ids = self._load_json(self._id_file)
+        self._ids_lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            settings['webhook'],
+            settings.get('author', 'Shortcode Notifier'),
+            settings.get('author_icon'),
+            settings.get('embed_title', 'Shortcode Update'),
+            settings.get('embed_color', '03b2f8'),
+            settings.get('timeout', 10.0)
+        )
 
     @property
     def name(self):
@@ -38,7 +50,15 @@ class Discord(BaseNotifier):
     def ids(self):
         return self._webhook_ids
 
+    def _get_webhook(self):
+        from discord_webhook import DiscordWebhook
+
+        return DiscordWebhook(url=self._url, username=self.name, rate_limit_retry=True,
+                              timeout=self.timeout)
+
     def _get_shortcode_embed(self, shortcode, image_url, image_filename, description):
+        from discord_webhook import DiscordEmbed
+
         icon_url = self.icon
         if not icon_url:
             icon_url = image_url
@@ -57,46 +77,48 @@ class Discord(BaseNotifier):
         return embed
 
     def notify(self, shortcode, image_url, image_filename, description):
-        webhook = DiscordWebhook(url=self._url, username=self.name, rate_limit_retry=True)
+        webhook = self._get_webhook()
         embed = self._get_shortcode_embed(shortcode, image_url, image_filename, description)
         webhook.add_embed(embed)
 
         logger.debug('Notifying Discord')
         response = webhook.execute()
-        logger.debug(f'Discord response: {response.status_code}')
-        logger.debug(f'Discord webhook id: {webhook.id}')
+        logger.debug('Discord response: %s', response.status_code)
+        logger.debug('Discord webhook id: %s', webhook.id)
 
         if webhook.id:
-            self.ids[shortcode] = webhook.id
-            self._save_json(self._id_file, self.ids)
-            logger.debug(f'Discord webhook ids updated with {webhook.id} for {shortcode}')
+            with self._ids_lock:
+                self.ids[shortcode] = webhook.id
+                self._save_json(self._id_file, self.ids)
+            logger.debug('Discord webhook ids updated with %s for %s', webhook.id, shortcode)
 
     def edit(self, shortcode, image_url, image_filename, description):
         if shortcode not in self.ids.keys():
-            logger.debug(f'Discord webhook id for {shortcode} not found')
+            logger.debug('Discord webhook id for %s not found', shortcode)
             return
 
-        webhook = DiscordWebhook(url=self._url, username=self.name, rate_limit_retry=True)
+        webhook = self._get_webhook()
         embed = self._get_shortcode_embed(shortcode, image_url, image_filename, description)
         webhook.add_embed(embed)
         webhook.id = self.ids[shortcode]
 
-        logger.debug(f'Editing Discord webhook id {webhook.id}')
+        logger.debug('Editing Discord webhook id %s', webhook.id)
         response = webhook.edit()
-        logger.debug(f'Discord response: {response.status_code}')
+        logger.debug('Discord response: %s', response.status_code)
 
     def delete(self, shortcode):
         if shortcode not in self.ids.keys():
-            logger.debug(f'Discord webhook id for {shortcode} not found')
+            logger.debug('Discord webhook id for %s not found', shortcode)
             return
 
-        webhook = DiscordWebhook(url=self._url, username=self.name, rate_limit_retry=True)
+        webhook = self._get_webhook()
         webhook.id = self.ids[shortcode]
 
-        logger.debug(f'Deleting Discord webhook id {webhook.id}')
+        logger.debug('Deleting Discord webhook id %s', webhook.id)
         response = webhook.delete()
-        logger.debug(f'Discord response: {response.status_code} Id: {webhook.id}')
+        logger.debug('Discord response: %s Id: %s', response.status_code, webhook.id)
         if 200 <= response.status_code < 300:
-            del self.ids[shortcode]
-            self._save_json(self._id_file, self.ids)
-            logger.debug(f'Discord webhook id removed {webhook.id} for {shortcode}')
+            with self._ids_lock:
+                self.ids.pop(shortcode, None)
+                self._save_json(self._id_file, self.ids)
+            logger.debug('Discord webhook id removed %s for %s', webhook.id, shortcode)
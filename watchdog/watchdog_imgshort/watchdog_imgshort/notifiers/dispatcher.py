@@ -0,0 +1,81 @@
+import concurrent.futures
+import contextvars
+import functools
+import logging
+import threading
+import time
+
+from .. import __logger__
+
+logger = logging.getLogger(__logger__)
+
+
+class NotifierDispatcher:
+    # calls every notifier at once and waits at most each notifier's timeout,
+    # a slow or failing notifier is logged without affecting the others
+    def __init__(self, workers=4):
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers),
+                                                               thread_name_prefix='notifier')
+        self._lock = threading.Lock()
+        # last call per notifier and shortcode, a timed out call keeps running and
+        # the next call for the same shortcode starts only once it is done
+        self._last = {}
+
+    def _run_after(self, previous, future, call):
+        def start(_):
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                self._executor.submit(call).add_done_callback(finish)
+            except Exception as error:
+                future.set_exception(error)
+
+        def finish(done):
+            error = done.exception()
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(done.result())
+
+        previous.add_done_callback(start)
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._last.get(key) is future:
+                del self._last[key]
+
+    def _submit(self, notifier, shortcode, call):
+        # carry the event id into the notifier thread
+        context = contextvars.copy_context()
+        call = functools.partial(context.run, call, notifier)
+        key = (notifier, shortcode)
+
+        with self._lock:
+            previous = self._last.get(key)
+            if previous is None or previous.done():
+                future = self._executor.submit(call)
+            else:
+                future = concurrent.futures.Future()
+                self._run_after(previous, future, call)
+            self._last[key] = future
+
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return future
+
+    def dispatch(self, notifiers, method, shortcode, call):
+        started = time.monotonic()
+        futures = [(notifier, self._submit(notifier, shortcode, call)) for notifier in notifiers]
+
+        for notifier, future in futures:
+            remaining = max(0.0, started + notifier.timeout - time.monotonic())
+            try:
+                future.result(timeout=remaining)
+            except concurrent.futures.TimeoutError:
+                logger.warning('Notifier %s timed out after %ss on %s', notifier.label, notifier.timeout, method)
+            except Exception as error:
+                logger.error('Notifier %s failed on %s: %s', notifier.label, method, error)
+
+        logger.debug('Notified %s notifiers in %.2fs', len(futures), time.monotonic() - started)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
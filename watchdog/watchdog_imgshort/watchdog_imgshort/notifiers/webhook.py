@@ -0,0 +1,64 @@
+import json
+import logging
+from urllib.request import Request, urlopen
+
+from .base import BaseNotifier
+from .. import __logger__
+
+logger = logging.getLogger(__logger__)
+
+
+class Webhook(BaseNotifier):
+    def __init__(self, url, headers=None, events=None, timeout=10.0):
+        super(Webhook, self).__init__(timeout)
+        self._url = url
+        self._headers = headers or {}
+        self._events = set(events or ('created', 'edited', 'deleted'))
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            settings['url'],
+            settings.get('headers'),
+            settings.get('events'),
+            settings.get('timeout', 10.0)
+        )
+
+    @property
+    def label(self):
+        return f'Webhook {self._url}'
+
+    def _post(self, event, payload):
+        if event not in self._events:
+            return
+
+        data = json.dumps(dict(payload, event=event)).encode('utf-8')
+        request = Request(self._url, data=data, method='POST')
+        request.add_header('Content-Type', 'application/json')
+        for header, value in self._headers.items():
+            request.add_header(header, value)
+
+        logger.debug('Notifying %s: %s', self.label, event)
+        with urlopen(request, timeout=self.timeout) as response:
+            logger.debug('Webhook response: %s', response.status)
+
+    def notify(self, shortcode, image_url, image_filename, description):
+        self._post('created', {
+            'shortcode': shortcode,
+            'url': image_url,
+            'filename': image_filename,
+            'description': description,
+        })
+
+    def edit(self, shortcode, image_url, image_filename, description):
+        self._post('edited', {
+            'shortcode': shortcode,
+            'url': image_url,
+            'filename': image_filename,
+            'description': description,
+        })
+
+    def delete(self, shortcode):
+        self._post('deleted', {
+            'shortcode': shortcode,
+        })
@@ -0,0 +1,247 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from . import __logger__
+
+logger = logging.getLogger(__logger__)
+
+# lossless only, pixel data is never altered and colour profiles are kept
+TOOLS = {
+    '.png': ['oxipng', '--quiet', '--opt', '2', '--strip', 'safe', '--out', '{output}', '{input}'],
+    '.apng': ['oxipng', '--quiet', '--opt', '2', '--strip', 'safe', '--out', '{output}', '{input}'],
+    '.jpg': ['jpegtran', '-copy', 'icc', '-optimize', '-progressive', '-outfile', '{output}', '{input}'],
+    '.jpeg': ['jpegtran', '-copy', 'icc', '-optimize', '-progressive', '-outfile', '{output}', '{input}'],
+}
+
+DEFAULT_THRESHOLDS = {
+    '.png': 16384,
+    '.apng': 16384,
+    '.jpg': 32768,
+    '.jpeg': 32768,
+}
+
+
+def _hash_file(filename):
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as _file:
+        for chunk in iter(lambda: _file.read(1048576), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _jpeg_orientation(filename):
+    # the EXIF Orientation tag, 1 when there is none
+    with open(filename, 'rb') as _file:
+        if _file.read(2) != b'\xff\xd8':
+            return 1
+
+        while True:
+            marker = _file.read(4)
+            if len(marker) < 4 or marker[0] != 0xff or marker[1] in (0xd9, 0xda):
+                return 1
+
+            length = struct.unpack('>H', marker[2:])[0]
+            if length < 2:
+                return 1
+            segment = _file.read(length - 2)
+            if marker[1] == 0xe1 and segment.startswith(b'Exif\x00\x00'):
+                break
+
+    tiff = segment[6:]
+    try:
+        order = '<' if tiff[:2] == b'II' else '>'
+        offset = struct.unpack(f'{order}I', tiff[4:8])[0]
+        entries = struct.unpack(f'{order}H', tiff[offset:offset + 2])[0]
+        for index in range(entries):
+            entry = tiff[offset + 2 + index * 12:offset + 14 + index * 12]
+            if struct.unpack(f'{order}H', entry[:2])[0] == 0x0112:
+                return struct.unpack(f'{order}H', entry[8:10])[0]
+    except struct.error:
+        pass
+    return 1
+
+
+def _run_tool(command, input_file, output_file):
+    command = [part.format(input=input_file, output=output_file) for part in command]
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=120)
+    return os.path.getsize(output_file)
+
+
+class Optimizer:
+    # least recently used entries and files go first, files used within
+    # keep_seconds are kept as they may be uploading right now
+    max_entries = 10000
+    keep_seconds = 3600
+
+    def __init__(self, cache_path, thresholds=None, workers=None, cache_size=1073741824):
+        self._cache_path = Path(cache_path)
+        self._cache_path.mkdir(parents=True, exist_ok=True)
+        self._cache_size = cache_size
+        self._index_file = Path(self._cache_path, 'index.json')
+        self._index = self._load_index()
+        self._index_lock = threading.Lock()
+
+        self._thresholds = dict(DEFAULT_THRESHOLDS)
+        for extension, threshold in (thresholds or {}).items():
+            self._thresholds[f'.{extension.lstrip(".").lower()}'] = threshold
+
+        self._tools = {extension: command for extension, command in TOOLS.items()
+                       if shutil.which(command[0])}
+        for extension in TOOLS.keys() - self._tools.keys():
+            logger.debug('Optimizer tool %s not found, %s files will not be optimized', TOOLS[extension][0], extension)
+
+        # the tools run as subprocesses from the upload threads, this bounds how many run at once
+        self._slots = threading.BoundedSemaphore(workers or os.cpu_count() or 1)
+
+    @property
+    def cache_path(self):
+        return self._cache_path
+
+    def _load_index(self):
+        if not self._index_file.is_file():
+            return {}
+
+        try:
+            with self._index_file.open('r') as _file:
+                index = json.load(_file)
+        except (OSError, ValueError) as error:
+            logger.warning('Optimizer index %s is unreadable, starting over: %s', self._index_file, error)
+            return {}
+        return index if isinstance(index, dict) else {}
+
+    def _save_index(self):
+        temp_file = self._index_file.with_suffix('.tmp')
+        with temp_file.open('w') as _file:
+            json.dump(self._index, _file)
+        os.replace(temp_file, self._index_file)
+
+    def _evict(self):
+        while len(self._index) > self.max_entries:
+            content_hash = next(iter(self._index))
+            self._remove_cached(self._index.pop(content_hash))
+
+        cached = []
+        for content_hash, name in self._index.items():
+            try:
+                stat = Path(self._cache_path, name).stat() if name else None
+            except OSError:
+                continue
+            if stat is not None:
+                cached.append((content_hash, name, stat.st_size, stat.st_mtime))
+
+        total = sum(size for _, _, size, _ in cached)
+        keep_after = time.time() - self.keep_seconds
+        for content_hash, name, size, used in cached:
+            if total <= self._cache_size or used >= keep_after:
+                break
+            self._index.pop(content_hash, None)
+            self._remove_cached(name)
+            total -= size
+
+    def _remove_cached(self, name):
+        if not name:
+            return
+        try:
+            os.remove(Path(self._cache_path, name))
+            logger.debug('Evicted optimized file %s', name)
+        except OSError:
+            pass
+
+    def _update_index(self, content_hash, value):
+        with self._index_lock:
+            self._index.pop(content_hash, None)
+            self._index[content_hash] = value
+            self._evict()
+            try:
+                self._save_index()
+            except OSError as error:
+                logger.error('Failed to save optimizer index: %s', error)
+
+    def _touch(self, content_hash, cached_file):
+        with self._index_lock:
+            if content_hash in self._index:
+                self._index[content_hash] = self._index.pop(content_hash)
+        try:
+            os.utime(cached_file)
+        except OSError:
+            pass
+
+    def _cached(self, content_hash, extension):
+        entry = self._index.get(content_hash)
+        if entry is None:
+            return None
+
+        if not entry:
+            # previously optimized without any gain, upload the original
+            return False
+
+        cached_file = Path(self._cache_path, f'{content_hash}{extension}')
+        if cached_file.is_file():
+            self._touch(content_hash, cached_file)
+            return cached_file
+
+        with self._index_lock:
+            self._index.pop(content_hash, None)
+        return None
+
+    def optimize(self, filename):
+        extension = Path(filename).suffix.lower()
+        if extension not in self._tools:
+            return filename
+
+        try:
+            original_size = os.path.getsize(filename)
+        except OSError:
+            return filename
+
+        if original_size < self._thresholds.get(extension, 0):
+            logger.debug('%s is below the optimization threshold', filename)
+            return filename
+
+        try:
+            if extension in ('.jpg', '.jpeg') and _jpeg_orientation(filename) != 1:
+                # the rotation lives in EXIF, which is not copied
+                logger.debug('%s is rotated by EXIF, not optimizing', filename)
+                return filename
+
+            content_hash = _hash_file(filename)
+        except OSError as error:
+            # removed or locked since the event
+            logger.error('Failed to read %s for optimization: %s', filename, error)
+            return filename
+        cached = self._cached(content_hash, extension)
+        if cached is False:
+            return filename
+        if cached:
+            logger.debug('Using cached optimized file for %s', filename)
+            return str(cached)
+
+        cached_file = Path(self._cache_path, f'{content_hash}{extension}')
+        with tempfile.TemporaryDirectory(dir=self._cache_path) as temp_dir:
+            temp_file = Path(temp_dir, f'{content_hash}{extension}')
+            try:
+                with self._slots:
+                    optimized_size = _run_tool(self._tools[extension], filename, str(temp_file))
+            except (OSError, subprocess.SubprocessError) as error:
+                logger.error('Failed to optimize %s: %s', filename, error)
+                return filename
+
+            if optimized_size >= original_size:
+                logger.debug('No gain optimizing %s', filename)
+                self._update_index(content_hash, '')
+                return filename
+
+            shutil.move(temp_file, cached_file)
+
+        self._update_index(content_hash, cached_file.name)
+        logger.info('Optimized %s from %s to %s bytes', Path(filename).name, original_size, optimized_size)
+        return str(cached_file)
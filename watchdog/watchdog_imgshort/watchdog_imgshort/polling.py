@@ -0,0 +1,232 @@
+import json
+import logging
+import os
+import threading
+import time
+from functools import partial
+
+from watchdog.events import FileCreatedEvent, FileDeletedEvent, FileModifiedEvent, FileMovedEvent
+from watchdog.observers.api import BaseObserver, EventEmitter
+
+from . import __logger__
+
+logger = logging.getLogger(__logger__)
+
+
+class ScanMetrics:
+    def __init__(self):
+        self.scans = 0
+        self.short_circuits = 0
+        self.full_scans = 0
+        self.entries = 0
+        self.stats = 0
+        self.events = 0
+        self.last_scan_seconds = 0.0
+        self.total_scan_seconds = 0.0
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+
+# polls a single directory with os.scandir:
+# - unchanged directory mtime, only recently written files are stat'ed again
+# - changed directory mtime, the directory is listed and only new entries are stat'ed
+# - every full_scan_every intervals all entries are stat'ed to pick up any other modification
+# - the snapshot is persisted, changes made while not running are emitted on start
+class ScandirEmitter(EventEmitter):
+    def __init__(self, event_queue, watch, timeout=1.0, snapshot_file=None, full_scan_every=30,
+                 settle_seconds=10.0, **kwargs):
+        super(ScandirEmitter, self).__init__(event_queue, watch, timeout=timeout, **kwargs)
+        self._lock = threading.Lock()
+        self._snapshot_file = snapshot_file
+        self._full_scan_every = max(1, full_scan_every)
+        self._settle_ns = int(settle_seconds * 1e9)
+        self._metrics = ScanMetrics()
+
+        self._entries = None
+        self._directory_mtime = None
+        self._hot = set()
+        self._since_full_scan = 0
+
+    @property
+    def metrics(self):
+        return self._metrics
+
+    def on_thread_start(self):
+        self._load_snapshot()
+
+    def on_thread_stop(self):
+        self._save_snapshot()
+
+    def _load_snapshot(self):
+        if not self._snapshot_file or not os.path.isfile(self._snapshot_file):
+            return
+
+        try:
+            with open(self._snapshot_file, 'r') as _file:
+                payload = json.load(_file)
+        except (OSError, ValueError) as error:
+            logger.error('Failed to load polling snapshot %s: %s', self._snapshot_file, error)
+            return
+
+        if payload.get('directory') != self.watch.path:
+            return
+
+        self._entries = {name: tuple(entry) for name, entry in payload.get('entries', {}).items()}
+        # force a full scan to emit whatever changed while not running
+        self._directory_mtime = None
+        self._since_full_scan = self._full_scan_every
+        logger.debug('Loaded polling snapshot with %s entries', len(self._entries))
+
+    def _save_snapshot(self):
+        if not self._snapshot_file or self._entries is None:
+            return
+
+        payload = {
+            'directory': self.watch.path,
+            'entries': self._entries,
+        }
+        temp_file = f'{self._snapshot_file}.tmp'
+        try:
+            with open(temp_file, 'w') as _file:
+                json.dump(payload, _file)
+            os.replace(temp_file, self._snapshot_file)
+        except OSError as error:
+            logger.error('Failed to save polling snapshot %s: %s', self._snapshot_file, error)
+
+    def _stat(self, path):
+        self._metrics.stats += 1
+        stat = os.stat(path)
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def _list(self, full):
+        entries = {}
+        with os.scandir(self.watch.path) as iterator:
+            for entry in iterator:
+                self._metrics.entries += 1
+                try:
+                    if not entry.is_file():
+                        continue
+
+                    if full or self._entries is None or entry.name not in self._entries or entry.name in self._hot:
+                        self._metrics.stats += 1
+                        stat = entry.stat()
+                        entries[entry.name] = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+                    else:
+                        entries[entry.name] = self._entries[entry.name]
+                except FileNotFoundError:
+                    continue
+        return entries
+
+    def _restat_hot(self):
+        entries = dict(self._entries)
+        for name in self._hot:
+            try:
+                entries[name] = self._stat(os.path.join(self.watch.path, name))
+            except FileNotFoundError:
+                # removed, the directory mtime will change and the next listing will emit the deletion
+                continue
+        return entries
+
+    def _scan(self):
+        try:
+            directory_mtime = os.stat(self.watch.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+
+        self._since_full_scan += 1
+        full = self._since_full_scan >= self._full_scan_every
+
+        if self._entries is not None and not full and directory_mtime == self._directory_mtime:
+            self._metrics.short_circuits += 1
+            if not self._hot:
+                return
+            entries = self._restat_hot()
+        else:
+            entries = self._list(full)
+            if full:
+                self._since_full_scan = 0
+                self._metrics.full_scans += 1
+
+        self._directory_mtime = directory_mtime
+
+        if self._entries is None:
+            self._entries = entries
+            self._update_hot()
+            self._save_snapshot()
+            return
+
+        if self._diff(self._entries, entries):
+            self._entries = entries
+            self._save_snapshot()
+        else:
+            self._entries = entries
+        self._update_hot()
+
+    def _update_hot(self):
+        threshold = time.time_ns() - self._settle_ns
+        self._hot = {name for name, (_, _, mtime) in self._entries.items() if mtime >= threshold}
+
+    def _emit(self, event):
+        self._metrics.events += 1
+        self.queue_event(event)
+
+    def _diff(self, old_entries, new_entries):
+        events = self._metrics.events
+        path = self.watch.path
+
+        created = new_entries.keys() - old_entries.keys()
+        deleted = old_entries.keys() - new_entries.keys()
+
+        deleted_inodes = {old_entries[name][0]: name for name in deleted}
+        for name in sorted(created):
+            inode = new_entries[name][0]
+            if inode and inode in deleted_inodes:
+                old_name = deleted_inodes.pop(inode)
+                deleted.discard(old_name)
+                self._emit(FileMovedEvent(os.path.join(path, old_name), os.path.join(path, name)))
+                continue
+
+            self._emit(FileCreatedEvent(os.path.join(path, name)))
+            # match the native observers, a written file is also modified
+            self._emit(FileModifiedEvent(os.path.join(path, name)))
+
+        for name in sorted(deleted):
+            self._emit(FileDeletedEvent(os.path.join(path, name)))
+
+        for name in new_entries.keys() & old_entries.keys():
+            if new_entries[name][1:] != old_entries[name][1:]:
+                self._emit(FileModifiedEvent(os.path.join(path, name)))
+
+        return self._metrics.events != events
+
+    def queue_events(self, timeout):
+        if self.stopped_event.wait(timeout):
+            return
+
+        with self._lock:
+            if not self.should_keep_running():
+                return
+
+            short_circuits = self._metrics.short_circuits
+            started = time.perf_counter()
+            self._scan()
+            seconds = time.perf_counter() - started
+
+            self._metrics.scans += 1
+            self._metrics.last_scan_seconds = seconds
+            self._metrics.total_scan_seconds += seconds
+            if self._metrics.short_circuits == short_circuits:
+                logger.debug('Polling scan of %s took %.1fms, metrics: %s',
+                             self.watch.path, seconds * 1000, self._metrics.as_dict())
+
+
+class ScandirObserver(BaseObserver):
+    def __init__(self, interval=2.0, snapshot_file=None, full_scan_every=30, settle_seconds=10.0):
+        emitter_class = partial(ScandirEmitter, snapshot_file=snapshot_file, full_scan_every=full_scan_every,
+                                settle_seconds=settle_seconds)
+        super(ScandirObserver, self).__init__(emitter_class, timeout=interval)
+
+    @property
+    def metrics(self):
+        return [emitter.metrics.as_dict() for emitter in self.emitters]
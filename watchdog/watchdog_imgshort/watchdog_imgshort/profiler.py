@@ -0,0 +1,38 @@
+import logging
+import time
+from contextlib import contextmanager
+
+from . import __logger__
+
+logger = logging.getLogger(__logger__)
+
+
+class StartupProfiler:
+    def __init__(self, started=None):
+        self._started = started if started is not None else time.perf_counter()
+        self._timings = []
+
+    @property
+    def timings(self):
+        return self._timings
+
+    def elapsed(self):
+        return time.perf_counter() - self._started
+
+    def record(self, name, seconds):
+        self._timings.append((name, seconds, self.elapsed()))
+
+    @contextmanager
+    def measure(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def report(self):
+        width = max([len(name) for name, _, _ in self._timings] + [4])
+        lines = [f'{"step":<{width}}  {"duration":>10}  {"at":>10}']
+        for name, seconds, at in self._timings:
+            lines.append(f'{name:<{width}}  {seconds * 1000:>8.1f}ms  {at * 1000:>8.1f}ms')
+        return '\n'.join(lines)
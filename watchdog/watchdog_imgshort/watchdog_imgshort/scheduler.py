@@ -0,0 +1,159 @@
+import contextvars
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+
+from . import __logger__
+
+logger = logging.getLogger(__logger__)
+
+
+class Job:
+    def __init__(self, sequence, keys, size, large, func, args):
+        self.sequence = sequence
+        self.keys = keys
+        self.size = size
+        self.large = large
+        self.func = func
+        self.args = args
+        self.context = contextvars.copy_context()
+        self.submitted = time.monotonic()
+
+    @property
+    def job_class(self):
+        return 'large' if self.large else 'small'
+
+    def priority(self, now, aging_seconds, aging_bytes, max_wait_seconds):
+        waited = now - self.submitted
+        if waited >= max_wait_seconds:
+            # waited too long, runs ahead of everything else, oldest first
+            return 0, self.submitted
+
+        # shortest job first, every aging_seconds waited takes aging_bytes off the size
+        return 1, self.size - waited / aging_seconds * aging_bytes
+
+
+class UploadScheduler:
+    def __init__(self, workers=4, large_threshold=16777216, large_share=0.5, aging_seconds=30.0,
+                 max_wait_seconds=300.0, report_every=50):
+        self._workers = max(1, workers)
+        self._large_threshold = large_threshold
+        self._large_slots = max(1, int(self._workers * large_share))
+        self._aging_seconds = max(0.001, aging_seconds)
+        self._aging_bytes = max(1, large_threshold)
+        self._max_wait_seconds = max_wait_seconds
+        self._report_every = report_every
+
+        self._condition = threading.Condition()
+        self._sequence = itertools.count()
+        self._pending = []
+        self._running = []
+        self._stopped = False
+        self._completed = 0
+        self._latency = {'small': deque(maxlen=1000), 'large': deque(maxlen=1000)}
+
+        self._threads = [
+            threading.Thread(target=self._worker, name=f'upload-{index}', daemon=True)
+            for index in range(self._workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, keys, size, func, *args):
+        job = Job(next(self._sequence), tuple(keys), size, size >= self._large_threshold, func, args)
+        with self._condition:
+            self._pending.append(job)
+            self._condition.notify_all()
+        return job
+
+    def _eligible(self, job, blocked_keys, large_running):
+        if any(key in blocked_keys for key in job.keys):
+            return False
+
+        return not job.large or large_running < self._large_slots
+
+    def _next_job(self):
+        if not self._pending:
+            return None
+
+        now = time.monotonic()
+        blocked_keys = {key for job in self._running for key in job.keys}
+        large_running = sum(1 for job in self._running if job.large)
+
+        selected = None
+        selected_priority = None
+        for job in self._pending:
+            # jobs for the same file run in the order they were submitted
+            if self._eligible(job, blocked_keys, large_running):
+                priority = job.priority(now, self._aging_seconds, self._aging_bytes, self._max_wait_seconds)
+                if selected is None or priority < selected_priority:
+                    selected, selected_priority = job, priority
+            blocked_keys.update(job.keys)
+
+        return selected
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                job = self._next_job()
+                while job is None:
+                    if self._stopped:
+                        return
+                    self._condition.wait()
+                    job = self._next_job()
+
+                self._pending.remove(job)
+                self._running.append(job)
+                waited = time.monotonic() - job.submitted
+                self._latency[job.job_class].append(waited)
+
+            logger.debug('Running %s job for %s, %s bytes, waited %.2fs', job.job_class, job.keys, job.size, waited)
+            try:
+                job.context.run(job.func, *job.args)
+            except Exception:
+                logger.exception('Job for %s failed', job.keys)
+            finally:
+                with self._condition:
+                    self._running.remove(job)
+                    self._completed += 1
+                    report = self._report_every and self._completed % self._report_every == 0
+                    self._condition.notify_all()
+
+            if report:
+                logger.info('Queue latency: %s', self.stats())
+
+    @staticmethod
+    def _percentile(values, percentile):
+        if not values:
+            return 0.0
+        index = min(len(values) - 1, int(round(percentile / 100.0 * (len(values) - 1))))
+        return values[index]
+
+    def stats(self):
+        with self._condition:
+            latency = {job_class: sorted(values) for job_class, values in self._latency.items()}
+            pending = {'small': 0, 'large': 0}
+            for job in self._pending:
+                pending[job.job_class] += 1
+
+        return {
+            job_class: {
+                'pending': pending[job_class],
+                'count': len(values),
+                'p50': round(self._percentile(values, 50), 3),
+                'p95': round(self._percentile(values, 95), 3),
+                'max': round(values[-1], 3) if values else 0.0,
+            }
+            for job_class, values in latency.items()
+        }
+
+    def shutdown(self, wait=True):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+        if wait:
+            for thread in self._threads:
+                thread.join()
@@ -0,0 +1,75 @@
+import queue
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+
+class BaseStorage(ABC):
+    @abstractmethod
+    def connect(self, reconnect=False):
+        pass
+
+    @abstractmethod
+    def put(self, filename, remote_path, remote_name=None):
+        pass
+
+    @abstractmethod
+    def remove(self, filename, remote_path):
+        pass
+
+    def remove_many(self, filenames, remote_path):
+        return {filename for filename in filenames if self.remove(filename, remote_path)}
+
+    @abstractmethod
+    def rename(self, filename, new_filename, remote_path):
+        pass
+
+    @abstractmethod
+    def disconnect(self):
+        pass
+
+
+class StoragePool:
+    # one storage client per concurrent job, idle clients are reused
+    def __init__(self, factory):
+        self._factory = factory
+        self._idle = queue.LifoQueue()
+        self._clients = []
+        self._closed = False
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def client(self):
+        try:
+            storage = self._idle.get_nowait()
+        except queue.Empty:
+            storage = self._factory()
+            with self._lock:
+                self._clients.append(storage)
+
+        try:
+            yield storage
+        finally:
+            with self._lock:
+                if not self._closed:
+                    self._idle.put(storage)
+                    storage = None
+            if storage is not None:
+                storage.disconnect()
+
+    def close(self):
+        # replaced by a new pool, idle clients are disconnected now and the
+        # clients of running jobs once they are handed back
+        with self._lock:
+            self._closed = True
+            idle = []
+            while not self._idle.empty():
+                idle.append(self._idle.get_nowait())
+
+        for storage in idle:
+            storage.disconnect()
+
+    def disconnect(self):
+        with self._lock:
+            for storage in self._clients:
+                storage.disconnect()
@@ -0,0 +1,146 @@
+import logging
+import mimetypes
+import os
+
+from .base import BaseStorage
+from .. import __logger__
+
+logger = logging.getLogger(__logger__)
+
+
+class S3(BaseStorage):
+    def __init__(self, endpoint_url, bucket, access_key, secret_key, region='auto',
+                 part_size=8388608, concurrency=4):
+        self._endpoint_url = endpoint_url.rstrip('/')
+        self._bucket = bucket
+        self._access_key = access_key
+        self._secret_key = secret_key
+        self._region = region
+        self._part_size = part_size
+        self._concurrency = concurrency
+        self._client = None
+        self._transfer_config = None
+
+    @property
+    def endpoint_url(self):
+        return self._endpoint_url
+
+    @property
+    def bucket(self):
+        return self._bucket
+
+    @property
+    def client(self):
+        return self._client
+
+    @staticmethod
+    def _key(remote_path, filename):
+        return '/'.join(part for part in (remote_path.strip('/'), os.path.basename(filename)) if part)
+
+    def connect(self, reconnect=False):
+        if reconnect:
+            self.disconnect()
+
+        if self._client is not None:
+            return
+
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+
+        logger.debug('S3 client connecting to %s', self.endpoint_url)
+        # clients from the default session are created from several upload threads at once,
+        # a session is not thread safe, each storage gets its own
+        session = boto3.session.Session()
+        self._client = session.client(
+            's3',
+            endpoint_url=self.endpoint_url,
+            aws_access_key_id=self._access_key,
+            aws_secret_access_key=self._secret_key,
+            region_name=self._region
+        )
+        # files larger than a part are uploaded as parallel multipart uploads
+        self._transfer_config = TransferConfig(
+            multipart_threshold=self._part_size,
+            multipart_chunksize=self._part_size,
+            max_concurrency=self._concurrency,
+            use_threads=True
+        )
+
+    def put(self, filename, remote_path, remote_name=None):
+        from botocore.exceptions import BotoCoreError, ClientError
+
+        self.connect()
+        key = self._key(remote_path, remote_name or filename)
+        content_type, _ = mimetypes.guess_type(key)
+        logger.debug('Uploading %s to s3://%s/%s', filename, self.bucket, key)
+        try:
+            self.client.upload_file(
+                filename, self.bucket, key,
+                ExtraArgs={'ContentType': content_type or 'application/octet-stream'},
+                Config=self._transfer_config
+            )
+        except FileNotFoundError:
+            logger.error('File not found')
+        except (BotoCoreError, ClientError) as error:
+            logger.error('Failure uploading %s: %s', key, error)
+
+    def remove(self, filename, remote_path):
+        from botocore.exceptions import BotoCoreError, ClientError
+
+        self.connect()
+        key = self._key(remote_path, filename)
+        logger.debug('Removing s3://%s/%s', self.bucket, key)
+        try:
+            self.client.delete_object(Bucket=self.bucket, Key=key)
+        except (BotoCoreError, ClientError) as error:
+            logger.error('Failure removing %s: %s', key, error)
+            return False
+        return True
+
+    def remove_many(self, filenames, remote_path):
+        from botocore.exceptions import BotoCoreError, ClientError
+
+        self.connect()
+        filenames = {self._key(remote_path, filename): filename for filename in filenames}
+        keys = list(filenames)
+        removed = set()
+        # DeleteObjects takes up to 1000 keys per request
+        for index in range(0, len(keys), 1000):
+            chunk = keys[index:index + 1000]
+            logger.debug('Removing %s objects from s3://%s', len(chunk), self.bucket)
+            try:
+                response = self.client.delete_objects(
+                    Bucket=self.bucket,
+                    Delete={'Objects': [{'Key': key} for key in chunk], 'Quiet': True}
+                )
+            except (BotoCoreError, ClientError) as error:
+                logger.error('Failure removing %s objects: %s', len(chunk), error)
+                continue
+
+            failed = set()
+            for error in response.get('Errors', []):
+                logger.error('Failure removing %s: %s', error.get('Key'), error.get('Message'))
+                failed.add(error.get('Key'))
+            removed.update(filenames[key] for key in chunk if key not in failed)
+        return removed
+
+    def rename(self, filename, new_filename, remote_path):
+        from botocore.exceptions import BotoCoreError, ClientError
+
+        self.connect()
+        old_key = self._key(remote_path, filename)
+        new_key = self._key(remote_path, new_filename)
+        logger.debug('Renaming s3://%s/%s to %s', self.bucket, old_key, new_key)
+        try:
+            # managed copy, large objects are copied in parts
+            self.client.copy({'Bucket': self.bucket, 'Key': old_key}, self.bucket, new_key,
+                             Config=self._transfer_config)
+            self.client.delete_object(Bucket=self.bucket, Key=old_key)
+        except (BotoCoreError, ClientError) as error:
+            logger.error('Failure renaming %s: %s', old_key, error)
+
+    def disconnect(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+            logger.debug('S3 client closed')
@@ -2,14 +2,13 @@ import logging
 import os
 import time
 
-import paramiko
-
-from . import __logger__
+from .base import BaseStorage
+from .. import __logger__
 
 logger = logging.getLogger(__logger__)
 
 
-class SFTP:
+class SFTP(BaseStorage):
     def __init__(self, host, user, password, port=22, **kwargs):
         self._host = host.rstrip('/')
         self._port = port
@@ -76,12 +75,14 @@ class SFTP:
             old_timestamp = self.timestamp
             self.timestamp = 'now'
             running_minutes, running_seconds = divmod(self.timestamp - old_timestamp, 60)
-            logger.debug(f'SFTP has been idle for {int(running_minutes)} minutes and {int(running_seconds)} seconds')
+            logger.debug('SFTP has been idle for %s minutes and %s seconds', int(running_minutes), int(running_seconds))
             if int(running_minutes) >= 5:
                 self.disconnect()
                 del self.timestamp
 
         if self.connection is None:
+            import paramiko
+
             for retry in range(5):
                 try:
                     logger.debug('SFTP attempting to connect')
@@ -101,10 +102,10 @@ class SFTP:
             self.connection = paramiko.SFTPClient.from_transport(self._transport)
             logger.debug('SFTP session connected')
 
-    def put(self, filename, remote_path):
+    def put(self, filename, remote_path, remote_name=None):
         self.connect()
-        remote_filename = '/'.join([remote_path, os.path.basename(filename)])
-        logger.debug(f'Uploading {filename} to {remote_filename}')
+        remote_filename = '/'.join([remote_path, remote_name or os.path.basename(filename)])
+        logger.debug('Uploading %s to %s', filename, remote_filename)
         try:
             self.connection.put(filename, remote_filename)
             if self._transport.get_exception():
@@ -125,7 +126,7 @@ class SFTP:
     def remove(self, filename, remote_path):
         self.connect()
         remote_filename = '/'.join([remote_path, os.path.basename(filename)])
-        logger.debug(f'Removing {remote_filename}')
+        logger.debug('Removing %s', remote_filename)
         try:
             self.connection.remove(remote_filename)
             if self._transport.get_exception():
@@ -137,17 +138,21 @@ class SFTP:
             self.connection.remove(remote_filename)
             self.timestamp = 'now'
         except FileNotFoundError:
+            # nothing left to remove
             logger.error('File not found on SFTP server')
         except PermissionError:
             logger.error('Permission denied removing file')
+            return False
         except OSError:
             logger.error('Failure')
+            return False
+        return True
 
     def rename(self, filename, new_filename, remote_path):
         self.connect()
         remote_filename = '/'.join([remote_path, os.path.basename(new_filename)])
         old_filename = '/'.join([remote_path, os.path.basename(filename)])
-        logger.debug(f'Renaming {old_filename} to {remote_filename}')
+        logger.debug('Renaming %s to %s', old_filename, remote_filename)
         try:
             self.connection.rename(old_filename, remote_filename)
             if self._transport.get_exception():